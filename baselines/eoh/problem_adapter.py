@@ -4,7 +4,9 @@ import subprocess
 import re
 
 from baselines.eoh.gls_tsp_adapt.gls_tsp_eval import Sandbox
-from utils.utils import block_until_running, file_to_string, filter_traceback
+from utils.result_channel import EvalProcess
+from utils.supervisor import supervise
+from utils.utils import candidate_workspace, file_to_string, filter_traceback, isolated_command, write_workspace
 
 class Prompts:
     def __init__(self, problem_cfg, root_dir:str):
@@ -64,7 +66,6 @@ class Problem:
         self.problem_size = self.config.problem.problem_size
         self.obj_type = self.config.problem.obj_type
         self.problem_type = self.config.problem.problem_type
-        self.output_file = f"{self.root_dir}/problems/{self.problem}/gpt.py"
 
         if self.problem_type == "tsp_constructive":
             from .original.prompts.tsp_greedy import GetPrompts
@@ -132,18 +133,14 @@ class Problem:
                 logging.debug(f"Iteration {self.iteration}: Processing Code Run {runid}")
 
                 if self.problem != 'tsp_gls':
-                    with open(self.output_file, 'w') as file:
-                        file.writelines(individual["code"] + '\n')
-
                     stdout_filepath = individual["stdout_filepath"]
+                    workspace_dir = write_workspace(individual["code"], candidate_workspace(stdout_filepath))
                     file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
 
-                    with open(stdout_filepath, 'w') as f:
-                        process = subprocess.Popen(
-                            ['python3', '-u', file_path, f'{self.problem_size}', self.root_dir, "train"], stdout=f,
-                            stderr=f)
+                    process = EvalProcess(
+                        isolated_command(file_path, workspace_dir, self.problem_size, self.root_dir, "train"),
+                        stdout_filepath)
 
-                    block_until_running(stdout_filepath, log_status=True)
                     inner_runs.append(process)
 
                 else:
@@ -186,8 +183,8 @@ class Problem:
                 inner_runs.append(None)
                 continue
 
-        # Wait for all processes to finish and collect results for non-Sandbox evaluations
-        for response_id, process in enumerate(inner_runs):
+        # Collect results for non-Sandbox evaluations, in the order the processes finish
+        for response_id, process in supervise(inner_runs, self.config.timeout):
             if process is None:
                 continue
 
@@ -203,14 +200,15 @@ class Problem:
             stdout_filepath = individual["stdout_filepath"]
 
             try:
-                with open(stdout_filepath, 'r') as f:
-                    stdout_str = f.read()
-
-                traceback_msg = filter_traceback(stdout_str)
+                result = process.channel.result
+                traceback_msg = ''
+                if result is None:  # No objective was reported, look for the error in the stdout file
+                    with open(stdout_filepath, 'r') as f:
+                        traceback_msg = filter_traceback(f.read()) or "Invalid stdout / objective value!"
 
                 if not traceback_msg:  # If execution has no error
                     try:
-                        individual["obj"] = float(stdout_str.split('\n')[-2])
+                        individual["obj"] = result["obj"]
                         assert individual["obj"] > 0, "Objective value <= 0 is not supported."
                         if self.obj_type == "max":
                             individual["obj"] = -individual["obj"]
@@ -4,7 +4,10 @@ import subprocess
 import re
 
 from baselines.eoh.gls_tsp_adapt.gls_tsp_eval import Sandbox
-from utils.utils import block_until_running, file_to_string, filter_traceback
+from behavior_descriptor.engine import batch_behavior_descriptors
+from utils.result_channel import EvalProcess
+from utils.supervisor import supervise
+from utils.utils import candidate_workspace, file_to_string, filter_traceback, isolated_command, write_workspace
 
 class Prompts:
     def __init__(self, problem_cfg, root_dir:str):
@@ -64,7 +67,6 @@ class Problem:
         self.problem_size = self.config.problem.problem_size
         self.obj_type = self.config.problem.obj_type
         self.problem_type = self.config.problem.problem_type
-        self.output_file = f"{self.root_dir}/problems/{self.problem}/gpt.py"
 
         if self.problem_type == "tsp_constructive":
             from .original.prompts.tsp_greedy import GetPrompts
@@ -132,18 +134,14 @@ class Problem:
                 logging.debug(f"Iteration {self.iteration}: Processing Code Run {runid}")
 
                 if self.problem != 'tsp_gls':
-                    with open(self.output_file, 'w') as file:
-                        file.writelines(individual["code"] + '\n')
-
                     stdout_filepath = individual["stdout_filepath"]
+                    workspace_dir = write_workspace(individual["code"], candidate_workspace(stdout_filepath))
                     file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
 
-                    with open(stdout_filepath, 'w') as f:
-                        process = subprocess.Popen(
-                            ['python3', '-u', file_path, f'{self.problem_size}', self.root_dir, "train"], stdout=f,
-                            stderr=f)
+                    process = EvalProcess(
+                        isolated_command(file_path, workspace_dir, self.problem_size, self.root_dir, "train"),
+                        stdout_filepath)
 
-                    block_until_running(stdout_filepath, log_status=True)
                     inner_runs.append(process)
 
                 else:
@@ -186,8 +184,12 @@ class Problem:
                 inner_runs.append(None)
                 continue
 
-        # Wait for all processes to finish and collect results for non-Sandbox evaluations
-        for response_id, process in enumerate(inner_runs):
+        # Behavior descriptors are computed in-process from the source while the evaluations run
+        bd_values = batch_behavior_descriptors([individual["code"] for individual in population],
+                                               self.config.bd_list, self.config.problem.func_name)
+
+        # Collect results for non-Sandbox evaluations, in the order the processes finish
+        for response_id, process in supervise(inner_runs, self.config.timeout):
             if process is None:
                 continue
 
@@ -199,27 +201,22 @@ class Problem:
                 process.kill()
                 continue
 
-            for bd in self.config.bd_list:
-                bd_process = self.behavior_descriptor(population[response_id], bd, response_id)
-                logging.info(f"bd_process: {bd_process}")
-
             individual = population[response_id]
             stdout_filepath = individual["stdout_filepath"]
 
             try:
-                with open(stdout_filepath, 'r') as f:
-                    stdout_str = f.read()
-
-                traceback_msg = filter_traceback(stdout_str)
+                result = process.channel.result
+                traceback_msg = ''
+                if result is None:  # No objective was reported, look for the error in the stdout file
+                    with open(stdout_filepath, 'r') as f:
+                        traceback_msg = filter_traceback(f.read()) or "Invalid stdout / objective value!"
+                elif bd_values[response_id] is None:
+                    traceback_msg = "Invalid behavior descriptor!"
 
                 if not traceback_msg:  # If execution has no error
                     try:
-                        # Split the output into lines
-                        lines = stdout_str.strip().split('\n')
-                        l = len(self.config.bd_list)
-                        individual["obj"] = float(lines[-(l+1)]) if self.obj_type == "min" else -float(lines[-(l+1)])
-                        for i, bd in enumerate(self.config.bd_list):
-                            individual[bd] = float(lines[-l + i])
+                        individual["obj"] = result["obj"] if self.obj_type == "min" else -result["obj"]
+                        individual.update(bd_values[response_id])
                         assert individual["obj"] > 0, "Objective value <= 0 is not supported."
                         if self.obj_type == "max":
                             individual["obj"] = -individual["obj"]
@@ -239,15 +236,3 @@ class Problem:
                 population[response_id] = self.mark_invalid_individual(individual, "Failed to read stdout")
 
         return population
-
-
-    def behavior_descriptor(self, individual: dict, bd_file_name: str, response_id) -> subprocess.Popen:
-        # Execute the python file with flags
-        with open(individual["stdout_filepath"], 'a') as f:
-            bd_file_path = f'{self.root_dir}/problems/{self.problem}/{bd_file_name}.py'
-            process = subprocess.Popen(['python3', '-u', bd_file_path], stdout=f, stderr=f)
-
-        block_until_running(individual["stdout_filepath"], log_status=True, iter_num=self.iteration, response_id=response_id)
-        process.wait()  # Wait for the subprocess to complete
-
-        return process
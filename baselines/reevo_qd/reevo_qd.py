@@ -5,6 +5,17 @@ import tiktoken
 from datetime import datetime
 import os
 from utils.utils import *
+from utils.run_store import flush as flush_run_store, record_evaluations, write_artifact
+from utils.checkpoint import checkpoint_path, load_checkpoint, save_checkpoint
+from utils.eval_cache import CachedRun, EvalCache
+from utils.eval_pool import EvalPool
+from utils.qd_archive import EmbeddingArchive, bd_archive
+from utils.embedding_service import EmbeddingService
+from utils.diversity import DiversityTracker
+from utils.racing import race
+from utils.result_channel import EvalProcess
+from utils.supervisor import supervise
+from behavior_descriptor.engine import batch_behavior_descriptors
 from baselines.reevo.gls_tsp_adapt.gls_tsp_eval import Sandbox
 from embedding_cluster import *
 
@@ -28,7 +39,13 @@ class ReEvo_QD:
         self.best_code_path_overall = None
 
         self.init_prompt()
-        self.init_population()
+        self.eval_pool = self.init_eval_pool()
+        self.eval_cache = self.init_eval_cache()
+        if self.cfg.resume:
+            load_checkpoint(self, checkpoint_path(self.cfg.resume, self.root_dir))
+        else:
+            self.init_population()
+            self.checkpoint(initial=True)
 
     def init_prompt(self) -> None:
         self.problem = self.cfg.problem.problem_name
@@ -36,6 +53,12 @@ class ReEvo_QD:
         self.problem_size = self.cfg.problem.problem_size
         self.func_name = self.cfg.problem.func_name
         self.obj_type = self.cfg.problem.obj_type
+        self.embedding_archive = EmbeddingArchive(self.cfg.alpha, self.obj_type)
+        self.embedding_service = EmbeddingService(
+            self.cfg.embedding_model, self.cfg.embedding_cache_path or f"{self.root_dir}/outputs/embedding_cache.sqlite",
+            self.cfg.embedding_batch_size) if self.cfg.qd_type == "embedding" or self.cfg.diversity_metrics else None
+        self.bd_archive = bd_archive(self.cfg) if self.cfg.qd_type == "bd" else None
+        self.diversity = DiversityTracker(self.cfg.swdi_similarity) if self.cfg.diversity_metrics else None
         self.problem_type = self.cfg.problem.problem_type
 
         logging.info("Problem: " + self.problem)
@@ -44,7 +67,6 @@ class ReEvo_QD:
         logging.info("Stop condition: " + self.cfg.stop_condition)
 
         self.prompt_dir = f"{self.root_dir}/baselines/reevo/prompts"
-        self.output_file = f"{self.root_dir}/problems/{self.problem}/gpt.py"
 
         # Loading all text prompts
         # Problem-specific prompt components
@@ -93,6 +115,46 @@ class ReEvo_QD:
         # self._my_log_path = os.path.join(_cur_file_, 'all_logs', f'{self.cfg.problem.problem_name}_{_cur_timestamp}')
         # os.makedirs(self._my_log_path, exist_ok=True)
 
+    def checkpoint(self, initial: bool = False) -> None:
+        """
+        Save the state of the run every cfg.checkpoint_every generations, and after the initial population, so that
+        it can be resumed with cfg.resume.
+        """
+        if self.cfg.checkpoint_every and (initial or self.generation % self.cfg.checkpoint_every == 0):
+            save_checkpoint(self)
+
+    def init_eval_pool(self) -> EvalPool:
+        """
+        Start the warm evaluation workers, if enabled. tsp_gls is evaluated in-process by the Sandbox.
+        """
+        if self.cfg.eval_workers <= 0 or self.problem == 'tsp_gls':
+            return None
+        logging.info(f"Starting {self.cfg.eval_workers} evaluation workers")
+        return EvalPool(f"{self.root_dir}/problems/{self.problem}", self.cfg.eval_workers, self.cfg.timeout,
+                        self.cfg.eval_worker_max_rss_mb)
+
+    def init_eval_cache(self) -> EvalCache:
+        """
+        Open the persistent evaluation cache, if enabled. tsp_gls is evaluated in-process by the Sandbox.
+        """
+        if not self.cfg.eval_cache or self.problem == 'tsp_gls':
+            return None
+        eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
+        return EvalCache(self.cfg.eval_cache_path or f"{self.root_dir}/outputs/eval_cache.sqlite", self.problem,
+                         self.problem_size, eval_file_path, (self.cfg.timeout, self.cfg.eval_instance_timeout))
+
+    def cached_run(self, individual: dict) -> CachedRun:
+        """
+        Replay of an earlier evaluation of the same heuristic, or None. Cache hits do not count as evaluations.
+        """
+        if self.eval_cache is None or individual["code"] is None:
+            return None
+        entry = self.eval_cache.get(individual["code"])
+        if entry is None:
+            return None
+        logging.info(f"Iteration {self.iteration}: Reusing cached evaluation ({self.eval_cache.hits} hits)")
+        return CachedRun(entry, individual["stdout_filepath"])
+
     def cal_usage_LLM(self, lst_prompt, lst_completion, encoding_name="cl100k_base"):
         """Returns the number of tokens in a text string."""
         encoding = tiktoken.get_encoding(encoding_name)
@@ -148,17 +210,13 @@ class ReEvo_QD:
 
             # Write to file
             file_name = f"problem_iter{self.iteration}_prompt{i}.txt"
-            with open(file_name, 'w') as file:
-                file.writelines(json.dumps(pre_messages))
+            write_artifact("prompts", file_name, json.dumps(pre_messages))
 
-        responses = multi_chat_completion(messages_lst, 1, self.cfg.model, self.cfg.temperature + 0.3)
-        self.cal_usage_LLM(messages_lst, responses)
+        population = self.stream_population(messages_lst, 1, self.cfg.temperature + 0.3)
         '''responses = multi_chat_completion([messages], self.cfg.init_pop_size, self.cfg.model,
                                           self.cfg.temperature + 0.3)  # Increase the temperature for diverse initial population'''
-        population = [self.response_to_individual(response, response_id) for response_id, response in
-                      enumerate(responses)]
 
-        # Run code and evaluate population
+        # Run code and evaluate population, while the responses are arriving
         population = self.evaluate_population(population)
         self.archive_evaluated_population(population)
 
@@ -172,8 +230,7 @@ class ReEvo_QD:
         """
         # Write response to file
         file_name = f"problem_iter{self.iteration}_response{response_id}.txt" if file_name is None else file_name + ".txt"
-        with open(file_name, 'w') as file:
-            file.writelines(response + '\n')
+        write_artifact("responses", file_name, response + '\n')
 
         code = extract_code_from_generator(response)
 
@@ -188,6 +245,22 @@ class ReEvo_QD:
         }
         return individual
 
+    def stream_population(self, messages_lst: list, n: int, temperature: float, parents: list = None):
+        """
+        Yield the individuals of the LLM responses in the order the responses arrive, so that evaluate_population
+        evaluates them while the remaining responses are being generated. `parents` gives the code paths of the
+        parents of each message, recorded in the individuals for the curiosity of the bd archive.
+        """
+        idle = None if self.eval_pool is None else lambda: self.eval_pool.step(0)
+        responses = {}
+        for response_id, response in stream_chat_completion(messages_lst, n, self.cfg.model, temperature, idle):
+            responses[response_id] = response
+            individual = self.response_to_individual(response, response_id)
+            if parents is not None:
+                individual["parents"] = parents[response_id // n]
+            yield individual
+        self.cal_usage_LLM(messages_lst, [responses[response_id] for response_id in sorted(responses)])
+
     def mark_invalid_individual(self, individual: dict, traceback_msg: str) -> dict:
         """
         Mark an individual as invalid.
@@ -203,8 +276,19 @@ class ReEvo_QD:
         """
         inner_runs = []
 
+        # `population` may be a stream of individuals whose responses are still arriving (see stream_population):
+        # each individual is launched as soon as it is available
+        individuals = population
+        population = []
+
         # Run code to evaluate
-        for response_id in range(len(population)):
+        for response_id, individual in enumerate(individuals):
+            population.append(individual)
+            cached_run = self.cached_run(population[response_id])
+            if cached_run is not None:
+                inner_runs.append(cached_run)
+                continue
+
             self.function_evals += 1
             # Skip if response is invalid
             if population[response_id]["code"] is None:
@@ -227,15 +311,32 @@ class ReEvo_QD:
             else:
                 try:
                     # Use default code execution for other problems
-                    process = self._run_code(population[response_id], response_id)
+                    process = self._run_code(population[response_id], response_id,
+                                             f":{self.cfg.racing_instances}" if self.cfg.racing else None)
                     inner_runs.append(process)
                 except Exception as e:  # If code execution fails
                     logging.info(f"Error for response_id {response_id}: {e}")
                     population[response_id] = self.mark_invalid_individual(population[response_id], str(e))
                     inner_runs.append(None)
 
-        # Update population with objective values
-        for response_id, inner_run in enumerate(inner_runs):
+        # Behavior descriptors are computed in-process from the source while the evaluations run
+        bd_values = batch_behavior_descriptors([individual["code"] for individual in population], self.cfg.bd_list,
+                                               self.func_name)
+        # Embeddings are requested while the evaluations run; those of failed candidates stay in the cache
+        embeddings = {}
+        if self.cfg.qd_type == "embedding" and self.cfg.embedding_prefetch:
+            embeddings = {response_id: self.embedding_service.submit(individual["code"])
+                          for response_id, individual in enumerate(population)
+                          if individual["code"] is not None and inner_runs[response_id] is not None}
+
+        if self.cfg.racing:  # Only the candidates not dominated on the first instances are evaluated on all of them
+            inner_runs = race(inner_runs, self.cfg.timeout, self.cfg.racing_instances, self.cfg.racing_alpha, self.obj_type,
+                              None if self.elitist is None else self.elitist.get("instance_objs"),
+                              lambda response_id: self._run_code(population[response_id], response_id,
+                                                                 f"{self.cfg.racing_instances}:"))
+
+        # Update population with objective values, in the order the evaluations finish
+        for response_id, inner_run in supervise(inner_runs, self.cfg.timeout):
             if inner_run is None:  # If code execution fails, skip
                 continue
 
@@ -262,27 +363,26 @@ class ReEvo_QD:
                     inner_run.kill()
                     continue
 
-                for bd in self.cfg.bd_list:
-                    bd_process = self.behavior_descriptor(population[response_id], bd, response_id)
-                    logging.info(f"bd_process: {bd_process}")
-
-                stdout_filepath = individual["stdout_filepath"]
-                with open(stdout_filepath, 'r') as f:  # read the stdout file
-                    stdout_str = f.read()
-                traceback_msg = filter_traceback(stdout_str)
+                result = inner_run.channel.result
+                if result is None:  # No objective was reported, look for the error in the stdout file
+                    with open(individual["stdout_filepath"], 'r') as f:
+                        traceback_msg = filter_traceback(f.read()) or "Invalid std out / objective value!"
+                elif not inner_run.channel.complete:  # Dominated after the first instances (racing)
+                    traceback_msg = (f"Dominated after the first {self.cfg.racing_instances} instances, "
+                                     f"not evaluated on the rest!")
+                elif bd_values[response_id] is None:
+                    traceback_msg = "Invalid behavior descriptor!"
+                else:
+                    traceback_msg = ''
 
                 if traceback_msg == '':  # If execution has no error
                     try:
-                        # Split the output into lines
-                        lines = stdout_str.strip().split('\n')
-                        l = len(self.cfg.bd_list)
-                        individual["obj"] = float(lines[-(l+1)]) if self.obj_type == "min" else -float(lines[-(l+1)])
-
-                        for i, bd in enumerate(self.cfg.bd_list):
-                            individual[bd] = float(lines[-l + i])
+                        individual["obj"] = result["obj"] if self.obj_type == "min" else -result["obj"]
+                        individual["instance_objs"] = [record["obj"] for record in inner_run.channel.instances]
+                        individual.update(bd_values[response_id])
 
                         if self.cfg.qd_type == "embedding":
-                            self.get_embedding(individual)
+                            self.get_embedding(individual, embeddings.get(response_id))
                         
                         individual["exec_success"] = True
                     except:
@@ -290,132 +390,50 @@ class ReEvo_QD:
                 else:  # Otherwise, also provide execution traceback error feedback
                     population[response_id] = self.mark_invalid_individual(population[response_id], traceback_msg)
 
+                if self.eval_cache is not None:
+                    self.eval_cache.put(individual["code"], inner_run, traceback_msg, bd_values[response_id])
+
             logging.info(f"Iteration {self.iteration}, response_id {response_id}: Objective value: {individual['obj']}")
+        if self.diversity is not None:
+            self.diversity.observe(population)
+        record_evaluations(population)
         return population
     
-    def _run_code(self, individual: dict, response_id) -> subprocess.Popen:
+    def _run_code(self, individual: dict, response_id, instances: str = None) -> subprocess.Popen:
         """
-        Write code into a file and run eval script.
+        Write code into the workspace of the individual and run eval script, on the slice `instances` of the
+        training instances if given (e.g. ":2").
         """
         logging.debug(f"Iteration {self.iteration}: Processing Code Run {response_id}")
 
-        with open(self.output_file, 'w') as file:
-            file.writelines(individual["code"] + '\n')
-
-        # Execute the python file with flags
-        with open(individual["stdout_filepath"], 'w') as f:
-            eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
-            process = subprocess.Popen(['python3', '-u', eval_file_path, f'{self.problem_size}', self.root_dir, "train"],
-                                       stdout=f, stderr=f)
-
-        block_until_running(individual["stdout_filepath"], log_status=True, iter_num=self.iteration,
-                            response_id=response_id)
+        workspace_dir = write_workspace(individual["code"], candidate_workspace(individual["stdout_filepath"]))
+        eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
 
-        return process
+        if self.eval_pool is not None:
+            return self.eval_pool.submit(eval_file_path, workspace_dir, [self.problem_size, self.root_dir, "train"],
+                                         individual["stdout_filepath"], instances)
 
-    def behavior_descriptor(self, individual: dict, bd_file_name: str, response_id) -> subprocess.Popen:
-        """
-        Write code into a file and run bd script.
-        """
-        with open(self.output_file, 'w') as file:
-            file.writelines(individual["code"] + '\n')
         # Execute the python file with flags
-        with open(individual["stdout_filepath"], 'a') as f:
-            bd_file_path = f'{self.root_dir}/problems/{self.problem}/{bd_file_name}.py'
-            process = subprocess.Popen(['python3', '-u', bd_file_path], stdout=f, stderr=f)
-
-        block_until_running(individual["stdout_filepath"], log_status=True, iter_num=self.iteration,
-                            response_id=response_id)
-        process.wait()  # Wait for the subprocess to complete
+        return EvalProcess(isolated_command(eval_file_path, workspace_dir, self.problem_size, self.root_dir, "train"),
+                           individual["stdout_filepath"], instances)
 
-        return process
     
-    def get_embedding(self, individual: dict):
-        code = individual["code"]
-        code_clean = remove_comments_and_docstrings(code)
-        code_pep8 = standardize_code(code_clean)
-        individual["embedding"] = get_nvidia_embedding(code_pep8, self.cfg.embedding_model)
+    def get_embedding(self, individual: dict, future=None):
+        if future is None:
+            future = self.embedding_service.submit(individual["code"])
+        individual["embedding"] = future.result()
     
     def archive_evaluated_population(self, evaluated_population: list[dict]) -> None:
-        # Create a dictionary to map bd values to individuals in self.population
-        bd_to_individual = {}
         # Only consider successful individuals
         valid_individuals = [ind for ind in evaluated_population if ind.get("exec_success", False)]
         print(len(valid_individuals))
         if self.cfg.qd_type == "embedding":
-            # Combine current population and new valid individuals
-            combined_population = self.population + valid_individuals
-            combined_embeddings = [ind["embedding"] for ind in combined_population]
-            clusters = []  # Each cluster is a list of indices in combined_population
-
-            for idx, emb in enumerate(combined_embeddings):
-                assigned = False
-                for cluster in clusters:
-                    # Check similarity with all members in the cluster
-                    sims = [cosine_similarity([emb], [combined_embeddings[member_idx]])[0][0] for member_idx in cluster]
-                    if all(sim > self.cfg.alpha for sim in sims):
-                        cluster.append(idx)
-                        assigned = True
-                        break
-                if not assigned:
-                    clusters.append([idx])
-
-            # For each cluster, keep only the best individual
-            best_individuals = []
-            for cluster in clusters:
-                cluster_inds = [combined_population[i] for i in cluster]
-                if self.obj_type == "min":
-                    best_ind = min(cluster_inds, key=lambda ind: ind["obj"])
-                else:
-                    best_ind = max(cluster_inds, key=lambda ind: ind["obj"])
-                best_individuals.append(best_ind)
-
-            # Update population with best individuals from clusters
-            self.population = best_individuals
+            # Cluster the current population and the new valid individuals, keeping the best individual of each cluster
+            self.population = self.embedding_archive.update(self.population, valid_individuals)
 
         if self.cfg.qd_type == "bd":
-            # Build from existing population
-            for individual in self.population:
-                if all(key in individual for key in self.cfg.bd_list):
-                    try:
-                        bd_values = tuple(
-                            individual[self.cfg.bd_list[i]] // div
-                            for i, div in enumerate(self.cfg.bd_step)
-                        )
-
-                        obj = individual['obj']
-                        if (bd_values not in bd_to_individual) or (obj < bd_to_individual[bd_values]['obj']):
-                            bd_to_individual[bd_values] = individual
-
-                    except KeyError as e:
-                        logging.info(f"Skipping individual due to missing key: {e}")
-                        continue
-
-            for evaluated_individual in valid_individuals:
-                try:
-                    # Get the behavior descriptor (bd) values as a tuple
-                    bd_values = tuple(
-                        evaluated_individual[self.cfg.bd_list[i]] // div
-                        for i, div in enumerate(self.cfg.bd_step)
-                    )
-
-                    if bd_values in bd_to_individual:
-                        # Compare objective values and keep the one with the lower obj value
-                        existing_individual = bd_to_individual[bd_values]
-                        if evaluated_individual["obj"] < existing_individual["obj"]:
-                            bd_to_individual[bd_values] = evaluated_individual
-                    else:
-                        # Add the new individual if no matching bd values exist
-                        bd_to_individual[bd_values] = evaluated_individual
-
-                except KeyError as e:
-                    # Log a warning and skip the individual if a key is missing
-                    missing_key = str(e)
-                    logging.info(f"Skipping individual due to missing behavior descriptor: {missing_key}")
-                    continue
-
-            # Update self.population with the archived individuals
-            self.population = list(bd_to_individual.values())
+            # Keep the best individual of each cell of the behavior descriptors
+            self.population = self.bd_archive.update(self.population, valid_individuals)
 
     def update_iter(self) -> None:
         """
@@ -441,14 +459,25 @@ class ReEvo_QD:
             {k: v for k, v in individual.items() if k != "embedding"}
             for individual in self.population
         ]
-        with open(f"population_iter{self.iteration}.json", "w") as f:
-            json.dump(population_to_dump, f, indent=2)
+        write_artifact("populations", f"population_iter{self.iteration}.json",
+                       json.dumps(population_to_dump, indent=2))
 
         logging.info(f"Iteration {self.iteration} finished...")
         logging.info(f"Best obj: {self.best_obj_overall}, Best Code Path: {self.best_code_path_overall}")
         logging.info(f"LLM usage: prompt_tokens = {self.prompt_tokens}, completion_tokens = {self.completion_tokens}")
         logging.info(f"LLM Requests: {self.llm_request}")
         logging.info(f"Function Evals: {self.function_evals}")
+        if self.cfg.qd_type == "bd" and self.generation > self.cfg.warm_up:
+            logging.info(f"Archive: {self.bd_archive.filled} cells, coverage = {self.bd_archive.coverage():.4f}")
+        if self.diversity is not None:
+            try:
+                metrics = self.diversity.step(self.embedding_service.embed)
+                logging.info(f"Iteration {self.iteration}: SWDI = {metrics['swdi']:.4f}, CDI = {metrics['cdi']:.4f}")
+                with open("diversity.jsonl", "a") as f:
+                    f.write(json.dumps({"iteration": self.iteration, "tokens": self.prompt_tokens + self.completion_tokens,
+                                        "best_obj": self.best_obj_overall, **metrics}) + "\n")
+            except Exception as e:
+                logging.info(f"Iteration {self.iteration}: diversity metrics failed: {e}")
         self.iteration += 1
 
     def update_generation(self) -> None:
@@ -457,6 +486,7 @@ class ReEvo_QD:
         logging.info(f"LLM usage: prompt_tokens = {self.prompt_tokens}, completion_tokens = {self.completion_tokens}")
         logging.info(f"LLM Requests: {self.llm_request}")
         logging.info(f"Function Evals: {self.function_evals}")
+        flush_run_store()
         self.generation += 1
 
     def rank_select(self, population: list[dict]) -> list[dict]:
@@ -475,9 +505,13 @@ class ReEvo_QD:
 
         # Sort by 'obj' (lower is better here)
         sorted_pop = sorted(population, key=lambda ind: ind["obj"])
-        ranks = np.arange(len(sorted_pop))
-        probs = 1 / (ranks + 1 + len(sorted_pop))
-        probs /= probs.sum()  # normalize to sum = 1
+        if self.cfg.qd_type == "bd" and self.cfg.bd_selection != "rank" and self.generation > self.cfg.warm_up:
+            # Uniform or curiosity-weighted selection of the elites of the archive
+            probs = self.bd_archive.selection_probabilities(sorted_pop, self.cfg.bd_selection)
+        else:
+            ranks = np.arange(len(sorted_pop))
+            probs = 1 / (ranks + 1 + len(sorted_pop))
+            probs /= probs.sum()  # normalize to sum = 1
 
         selected_population = []
         trial = 0
@@ -572,14 +606,13 @@ class ReEvo_QD:
         self.cal_usage_LLM([messages], [self.long_term_reflection_str])
         # Write reflections to file
         file_name = f"problem_iter{self.iteration}_short_term_reflections.txt"
-        with open(file_name, 'w') as file:
-            file.writelines("\n".join(short_term_reflections) + '\n')
+        write_artifact("reflections", file_name, "\n".join(short_term_reflections) + '\n')
 
         file_name = f"problem_iter{self.iteration}_long_term_reflection.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(self.long_term_reflection_str + '\n')
+        write_artifact("reflections", file_name, self.long_term_reflection_str + '\n')
 
-    def crossover(self, short_term_reflection_tuple: tuple[list[list[dict]], list[str], list[str]]) -> list[dict]:
+    def crossover(self, short_term_reflection_tuple: tuple[list[list[dict]], list[str], list[str]],
+                  parents: list = None) -> list[dict]:
         reflection_content_lst, worse_code_lst, better_code_lst = short_term_reflection_tuple
         messages_lst = []
         num_choice = 0
@@ -604,8 +637,7 @@ class ReEvo_QD:
 
             # Write to file
             file_name = f"problem_iter{self.iteration}_response{num_choice}_prompt.txt"
-            with open(file_name, 'w') as file:
-                file.writelines(json.dumps(pre_messages))
+            write_artifact("prompts", file_name, json.dumps(pre_messages))
             num_choice += 1
 
             # Print crossover prompt for the first iteration
@@ -614,13 +646,8 @@ class ReEvo_QD:
                 self.print_crossover_prompt = False
 
         # Asynchronously generate responses
-        response_lst = multi_chat_completion(messages_lst, 1, self.cfg.model, self.cfg.temperature)
-        self.cal_usage_LLM(messages_lst, response_lst)
-        crossed_population = [self.response_to_individual(response, response_id) for response_id, response in
-                              enumerate(response_lst)]
-
-        assert len(crossed_population) == self.cfg.pop_size
-        return crossed_population
+        assert len(messages_lst) == self.cfg.pop_size
+        return self.stream_population(messages_lst, 1, self.cfg.temperature, parents)
 
     def mutate(self) -> list[dict]:
         """Elitist-based mutation. We only mutate the best individual to generate n_pop new individuals."""
@@ -639,17 +666,13 @@ class ReEvo_QD:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         if self.print_mutate_prompt:
             logging.info("Mutation Prompt: \nSystem Prompt: \n" + system + "\nUser Prompt: \n" + user)
             self.print_mutate_prompt = False
-        responses = multi_chat_completion([messages], int(self.cfg.pop_size * self.mutation_rate), self.cfg.model, self.cfg.temperature)
-        self.cal_usage_LLM([messages], responses)
-        population = [self.response_to_individual(response, response_id) for response_id, response in
-                      enumerate(responses)]
-        return population
+        return self.stream_population([messages], int(self.cfg.pop_size * self.mutation_rate), self.cfg.temperature,
+                                      [[self.elitist["code_path"]]])
 
     def stop(self) -> bool:
         """
@@ -680,7 +703,9 @@ class ReEvo_QD:
             # Short-term reflection
             short_term_reflection_tuple = self.short_term_reflection(selected_population)  # (response_lst, worse_code_lst, better_code_lst)
             # Crossover
-            crossed_population = self.crossover(short_term_reflection_tuple)
+            parents = [[selected_population[i]["code_path"], selected_population[i + 1]["code_path"]]
+                       for i in range(0, len(selected_population), 2)]
+            crossed_population = self.crossover(short_term_reflection_tuple, parents)
             # Evaluate
             evaluated_population = self.evaluate_population(crossed_population)
             if self.generation <= self.cfg.warm_up:
@@ -702,6 +727,7 @@ class ReEvo_QD:
             # Update
             self.update_iter()
             self.update_generation()
+            self.checkpoint()
 
         logging.info(f"Token used: {(self.prompt_tokens + self.completion_tokens)}.")
         return self.best_code_overall, self.best_code_path_overall
\ No newline at end of file
@@ -4,6 +4,8 @@ from omegaconf import OmegaConf
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+from behavior_descriptor.engine import behavior_descriptors
+from utils.run_store import RunStore
 
 def filter_traceback(stdout_str):
     if "Traceback" in stdout_str:
@@ -12,23 +14,45 @@ def filter_traceback(stdout_str):
 
 def read_bd_values_from_stdout(folder, bd_list, bd_step):
     bd_arrays = {bd: [] for bd in bd_list}
+    func_name = OmegaConf.load(os.path.join(folder, ".hydra", "config.yaml")).problem.func_name
     for stdout_filepath in sorted(glob.glob(os.path.join(folder, "*.txt_stdout.txt"))):
         with open(stdout_filepath, 'r') as f:
             stdout_str = f.read()
         traceback_msg = filter_traceback(stdout_str)
         if traceback_msg == '':
             try:
-                lines = stdout_str.strip().split('\n')
-                l = len(bd_list)
-                for i, bd in enumerate(bd_list):
-                    val = float(lines[-l + i])
-                    bd_arrays[bd].append(val)
+                code_path = os.path.join(folder, "workspaces", os.path.basename(stdout_filepath)[:-len(".txt")], "gpt.py")
+                if os.path.isfile(code_path):
+                    with open(code_path, 'r') as f:
+                        values = behavior_descriptors(f.read(), bd_list, func_name)
+                else:  # Older runs printed the descriptors at the end of the stdout file
+                    lines = stdout_str.strip().split('\n')
+                    values = {bd: float(lines[-len(bd_list) + i]) for i, bd in enumerate(bd_list)}
+                for bd in bd_list:
+                    bd_arrays[bd].append(values[bd])
             except Exception as e:
                 print(f"Error parsing {stdout_filepath}: {e}")
         else:
             print(f"Error in {stdout_filepath}: {traceback_msg}")
     return bd_arrays
 
+def read_bd_values_from_store(store, run, folder, bd_list):
+    bd_arrays = {bd: [] for bd in bd_list}
+    func_name = OmegaConf.load(os.path.join(folder, ".hydra", "config.yaml")).problem.func_name
+    for individual in store.individuals(run):
+        if not individual["exec_success"]:
+            continue
+        try:
+            if all(bd in individual for bd in bd_list):
+                values = individual
+            else:
+                values = behavior_descriptors(individual["code"], bd_list, func_name)
+            for bd in bd_list:
+                bd_arrays[bd].append(values[bd])
+        except Exception as e:
+            print(f"Error computing the descriptors of {individual.get('code_path')}: {e}")
+    return bd_arrays
+
 if __name__ == "__main__":
     # Load bd_list and bd_step from config.yaml
     config = OmegaConf.load("cfg/config.yaml")
@@ -38,6 +62,10 @@ if __name__ == "__main__":
     # Define which are "integer-like"
     int_metrics = {"SLOC", "cyclomatic_complexity", "token_count"}
 
+    run_store_path = config.run_store_path or "outputs/runs.sqlite"
+    store = RunStore(run_store_path) if os.path.exists(run_store_path) else None
+    stored_runs = set(store.runs()) if store is not None else set()
+
     # Loop over each folder in outputs/main
     for folder in sorted(glob.glob("outputs/main/*")):
         if not os.path.isdir(folder):
@@ -47,7 +75,10 @@ if __name__ == "__main__":
         dist_folder = os.path.join("bd_analyze", folder_name)
         os.makedirs(dist_folder, exist_ok=True)
 
-        bd_arrays = read_bd_values_from_stdout(folder, bd_list, bd_step)
+        if folder_name in stored_runs:
+            bd_arrays = read_bd_values_from_store(store, folder_name, folder, bd_list)
+        else:
+            bd_arrays = read_bd_values_from_stdout(folder, bd_list, bd_step)
 
         for bd in bd_list:
             plt.figure()
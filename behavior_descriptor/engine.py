@@ -0,0 +1,88 @@
+"""
+In-process behavior descriptors of heuristic code.
+
+Computes the metrics of the scripts in this folder and in problems/<problem>/ (SLOC, cyclomatic complexity,
+Halstead volume, maintainability index, token count) directly from the candidate source. The heuristic
+function is located and parsed once per candidate and every metric is derived from that parse, instead of
+starting one Python process per metric that re-imports `gpt`.
+"""
+import ast
+import io
+import logging
+import tokenize
+
+from radon.complexity import cc_visit_ast
+from radon.metrics import h_visit_ast, mi_compute
+from radon.raw import analyze
+from radon.visitors import ComplexityVisitor
+
+# Heuristics that the evaluation scripts (and the former descriptor scripts of their problem) import by version, e.g.
+# `from gpt import priority_v2 as priority`, rather than taking the first defined of `heuristics`, `heuristics_v1`...
+VERSIONED_FUNCTIONS = {
+    "priority": "priority_v2",
+    "select_next_node": "select_next_node_v2",
+    "update_edge_distance": "update_edge_distance_v2",
+}
+
+
+def heuristic_source(code: str, func_name: str) -> str:
+    """
+    Source of the heuristic function defined in `code`, as `inspect.getsource` returns it: the function the
+    evaluation script runs, i.e. its version in VERSIONED_FUNCTIONS if defined, otherwise the first of `func_name`,
+    `func_name_v1`, `func_name_v2`, `func_name_v3`.
+    """
+    module = ast.parse(code)
+    functions = {node.name: node for node in module.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    names = [func_name] + [f"{func_name}_v{version}" for version in range(1, 4)]
+    if func_name in VERSIONED_FUNCTIONS:
+        names.insert(0, VERSIONED_FUNCTIONS[func_name])
+    for name in names:
+        if name in functions:
+            node = functions[name]
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            return "\n".join(code.splitlines()[start - 1:node.end_lineno]) + "\n"
+    raise ValueError(f"No heuristic function named {func_name} found.")
+
+
+def behavior_descriptors(code: str, bd_list: list[str], func_name: str) -> dict:
+    """Compute the behavior descriptors in `bd_list` for the heuristic function in `code`."""
+    source = heuristic_source(code, func_name)
+    tree = ast.parse(source)
+    raw = analyze(source)
+
+    values = {}
+    for bd in bd_list:
+        if bd == "SLOC":
+            values[bd] = float(raw.sloc)
+        elif bd == "cyclomatic_complexity":
+            values[bd] = float(cc_visit_ast(tree)[0].complexity)
+        elif bd == "halstead":
+            values[bd] = float(h_visit_ast(tree).total.volume)
+        elif bd == "mi":
+            # Same as radon.metrics.mi_visit(source, True), without parsing the source again
+            comments = (raw.comments + raw.multi) / float(raw.sloc) * 100 if raw.sloc != 0 else 0
+            values[bd] = float(mi_compute(h_visit_ast(tree).total.volume,
+                                          ComplexityVisitor.from_ast(tree).total_complexity, raw.lloc, comments))
+        elif bd == "token_count":
+            values[bd] = float(len(list(tokenize.generate_tokens(io.StringIO(source).readline))))
+        else:
+            raise ValueError(f"Unknown behavior descriptor: {bd}")
+    return values
+
+
+def batch_behavior_descriptors(codes: list[str], bd_list: list[str], func_name: str) -> list[dict]:
+    """
+    Compute the behavior descriptors of a whole population.
+    Returns one dict per code, or None if the code is missing or its heuristic function cannot be analyzed.
+    """
+    results = []
+    for code in codes:
+        if code is None:
+            results.append(None)
+            continue
+        try:
+            results.append(behavior_descriptors(code, bd_list, func_name))
+        except Exception as e:
+            logging.info(f"Behavior descriptor computation failed: {e}")
+            results.append(None)
+    return results
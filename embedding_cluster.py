@@ -87,18 +87,19 @@ def get_nvidia_embedding(text, model, input_type="query"):
     )
     return np.array(response['data'][0]['embedding'])
 
-def cluster_by_embedding(heuristic_files, alpha=0.95, model_name="nvidia_nim/nvidia/llama-3.2-nemoretriever-1b-vlm-embed-v1"):
+def cluster_by_embedding(heuristic_files, alpha=0.95, model_name="nvidia_nim/nvidia/llama-3.2-nemoretriever-1b-vlm-embed-v1",
+                         cache_path="outputs/embedding_cache.sqlite"):
+    from utils.embedding_service import EmbeddingService
+
     codes = []
     file_names = []
     for hfile in heuristic_files:
         with open(hfile, "r", encoding="utf-8") as f:
-            code = f.read()
-        code_clean = remove_comments_and_docstrings(code)
-        code_pep8 = standardize_code(code_clean)
-        codes.append(code_pep8)
+            codes.append(f.read())
         file_names.append(hfile)
 
-    embeddings = [get_nvidia_embedding(code, model=model_name, input_type="query") for code in codes]
+    # Batched requests; files embedded before (by this script or a QD run) come from the cache
+    embeddings = EmbeddingService(model_name, cache_path).embed(codes)
     clusters = []
     assignments = {}
 
@@ -0,0 +1,22 @@
+"""
+Write runs stored in the run database (run_store=True) back to the file layout of the runs without it.
+
+Usage: python export_run.py [run ...] [--store outputs/runs.sqlite] [--out outputs/main]
+Without runs, every stored run is exported. The files of a run are written to <out>/<run>.
+"""
+import argparse
+import os
+
+from utils.run_store import RunStore
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("runs", nargs="*", help="runs to export (names of their run directories)")
+    parser.add_argument("--store", default="outputs/runs.sqlite", help="run database")
+    parser.add_argument("--out", default="outputs/main", help="directory of the exported runs")
+    args = parser.parse_args()
+
+    store = RunStore(args.store)
+    for run in args.runs or store.runs():
+        count = store.export(run, os.path.join(args.out, run))
+        print(f"Exported {count} files of {run} to {os.path.join(args.out, run)}")
@@ -4,6 +4,11 @@ import os
 from pathlib import Path
 import subprocess
 from dotenv import load_dotenv
+from utils.utils import candidate_workspace, isolated_command, write_workspace
+from utils.llm_client import configure as configure_llm_client
+from utils.llm_cache import LLMCache
+from utils.run_store import configure as configure_run_store
+from utils.result_channel import INSTANCE_TIMEOUT_ENV, INSTANCE_WORKERS_ENV
 
 ROOT_DIR = os.getcwd()
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +26,24 @@ def main(cfg):
     logging.info(f"Project Root: {ROOT_DIR}")
     logging.info(f"Using LLM: {cfg.model}")
     logging.info(f"Using Algorithm: {cfg.algorithm}")
+    llm_cache = None
+    if cfg.llm_cache and cfg.llm_cache != "off":
+        llm_cache = LLMCache(cfg.llm_cache_path or f"{ROOT_DIR}/outputs/llm_cache.sqlite", cfg.llm_cache,
+                             cfg.llm_cache_max_size_mb)
+        logging.info(f"LLM cache: {cfg.llm_cache}")
+    configure_llm_client(concurrency=cfg.llm_concurrency, provider_concurrency=cfg.llm_provider_concurrency,
+                         rpm=cfg.llm_rpm, tpm=cfg.llm_tpm, max_retries=cfg.llm_max_retries,
+                         max_connections=cfg.llm_max_connections, cache=llm_cache)
+    # Cores of each evaluation for its instances: by default, the cores of this run shared by the concurrent evaluations,
+    # of which there are the most while evaluating the initial population
+    concurrent_evals = cfg.eval_workers if cfg.eval_workers > 0 else max(cfg.pop_size, cfg.init_pop_size)
+    os.environ[INSTANCE_WORKERS_ENV] = str(cfg.eval_instance_workers or
+                                           max(1, len(os.sched_getaffinity(0)) // concurrent_evals))
+    os.environ[INSTANCE_TIMEOUT_ENV] = str(cfg.eval_instance_timeout or 0)
+    if cfg.run_store:
+        run_store_path = cfg.run_store_path or f"{ROOT_DIR}/outputs/runs.sqlite"
+        configure_run_store(run_store_path, workspace_dir.name)
+        logging.info(f"Run store: {run_store_path}, run {workspace_dir.name}")
 
     if cfg.algorithm == "hsevo":
         from hsevo import HSEvo as LHH
@@ -48,13 +71,12 @@ def main(cfg):
     logging.info(f"Best Code Path Overall: {best_code_path_overall}")
     
     # Run validation and redirect stdout to a file "best_code_overall_stdout.txt"
-    with open(f"{ROOT_DIR}/problems/{cfg.problem.problem_name}/gpt.py", 'w') as file:
-        file.writelines(best_code_overall + '\n')
     test_script = f"{ROOT_DIR}/problems/{cfg.problem.problem_name}/eval.py"
     test_script_stdout = "best_code_overall_val_stdout.txt"
+    workspace_dir = write_workspace(best_code_overall, candidate_workspace(test_script_stdout))
     logging.info(f"Running validation script...: {test_script}")
     with open(test_script_stdout, 'w') as stdout:
-        subprocess.run(["python3", test_script, "-1", ROOT_DIR, "val"], stdout=stdout)
+        subprocess.run(isolated_command(test_script, workspace_dir, -1, ROOT_DIR, "val"), stdout=stdout)
     logging.info(f"Validation script finished. Results are saved in {test_script_stdout}.")
     
     # Print the results
@@ -4,6 +4,8 @@ import json
 import matplotlib.pyplot as plt
 from omegaconf import OmegaConf
 import math
+from utils.qd_archive import GridArchive
+from utils.run_store import RunStore
 
 # Your BD configuration
 config = OmegaConf.load("cfg/config.yaml")
@@ -11,29 +13,9 @@ bd_list = config.bd_list
 bd_step = config.bd_step
 
 main_dir = "outputs/main"
-
-def compute_bd_ranges_and_bins(population, bd_list, bd_step):
-    bd_min = {bd: float('inf') for bd in bd_list}
-    bd_max = {bd: float('-inf') for bd in bd_list}
-
-    for individual in population:
-        for i, bd in enumerate(bd_list):
-            val = individual.get(bd)
-            if val is not None:
-                bd_min[bd] = min(bd_min[bd], val)
-                bd_max[bd] = max(bd_max[bd], val)
-
-    bd_ranges = {bd: (bd_min[bd], bd_max[bd]) for bd in bd_list}
-    possible_bins = 1
-    for i, bd in enumerate(bd_list):
-        min_v, max_v = bd_ranges[bd]
-        if min_v == float('inf') or max_v == float('-inf'):
-            n_bins = 1
-        else:
-            n_bins = int((max_v - min_v) // bd_step[i]) + 1
-        possible_bins *= n_bins
-
-    return bd_ranges, possible_bins
+run_store_path = config.run_store_path or "outputs/runs.sqlite"
+store = RunStore(run_store_path) if os.path.exists(run_store_path) else None
+stored_runs = set(store.runs()) if store is not None else set()
 
 # Loop through each experiment folder
 for folder in sorted(glob.glob(os.path.join(main_dir, "*"))):
@@ -50,26 +32,25 @@ for folder in sorted(glob.glob(os.path.join(main_dir, "*"))):
     density_ratios = []
     avg_objectives = []
 
-    # Process each iteration JSON
-    for json_file in sorted(glob.glob(os.path.join(folder, "population_iter*.json"))):
-        iter_num = int(os.path.splitext(os.path.basename(json_file))[0].split("population_iter")[1])
-
-        with open(json_file, 'r') as f:
-            population = json.load(f)
-
-        # Count unique BD bins (tuples of bd values divided by bd_step)
-        unique_bins = set()
+    # Population of each iteration, from the run store or the population_iter*.json files
+    if folder_name in stored_runs:
+        populations = [(iteration, json.loads(content)) for iteration, _, content in
+                       store.artifacts(folder_name, "populations")]
+    else:
+        populations = []
+        for json_file in sorted(glob.glob(os.path.join(folder, "population_iter*.json"))):
+            iter_num = int(os.path.splitext(os.path.basename(json_file))[0].split("population_iter")[1])
+            with open(json_file, 'r') as f:
+                populations.append((iter_num, json.load(f)))
+
+    for iter_num, population in populations:
+
+        # Cells of the BD grid filled by the population, out of the cells of their bounding box
+        archive = GridArchive(bd_list, bd_step)
         for individual in population:
-            try:
-                bin_tuple = tuple(
-                    int(individual.get(bd, 0) // bd_step[i])
-                    for i, bd in enumerate(bd_list)
-                )
-                unique_bins.add(bin_tuple)
-            except Exception:
-                continue
-        n_bins = len(unique_bins)
-        bd_ranges, max_possible_bins = compute_bd_ranges_and_bins(population, bd_list, bd_step)
+            archive.insert(individual)
+        n_bins = archive.filled
+        max_possible_bins = archive.size()
 
         # Calculate average objective
         total_obj = 0
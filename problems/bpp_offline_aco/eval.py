@@ -3,10 +3,12 @@ import numpy as np
 import logging
 from gen_inst import BPPInstance, load_dataset, dataset_conf
 import sys
+import time
 sys.path.insert(0, "../../../")
 
 import gpt
 from utils.utils import get_heuristic_name
+from utils.result_channel import report_instance, report_result, select_instances
 
 
 possible_func_names = ["heuristics", "heuristics_v1", "heuristics_v2", "heuristics_v3"]
@@ -57,13 +59,16 @@ if __name__ == "__main__":
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i, instance in enumerate(dataset):
+        for i, instance in select_instances(enumerate(dataset)):
+            start_time = time.perf_counter()
             obj = solve(instance, mode=method)
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj)
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
 
     else: # mood == 'val'
         for problem_size in dataset_conf['val']:
@@ -35,8 +35,9 @@ def generate_datasets(basepath = None):
             generate_dataset(filepath, n, batch_size=5 if mood =='train' else 64)
 
 def load_dataset(fp) -> list[BPPInstance]:
-    data = np.load(fp)
-    demands = data['demands']
+    # Demands memory-mapped from the dataset store
+    from utils.dataset_store import open_dataset
+    demands = open_dataset(fp)['demands']
     instances = []
     n = demands.shape[1]
     for demand in demands:
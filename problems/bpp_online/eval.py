@@ -2,11 +2,16 @@
 Adapted from https://github.com/google-deepmind/funsearch
 """
 
+import multiprocessing
 import numpy as np
-import pickle
+import signal
 import sys
+import time
+sys.path.insert(0, "../../../")
 
 from gpt import priority_v2 as priority
+from utils.result_channel import (EvaluationTimeout, instance_timeout, instance_workers, report_instance,
+                                  report_result, report_timeout, select_instances)
 
 
 def get_valid_bin_indices(item: float, bins: np.ndarray) -> np.ndarray:
@@ -35,27 +40,259 @@ def online_binpack(
     return packing, bins
 
 
+def online_binpack_open_bins(
+    items: tuple[float, ...], capacity: float
+) -> tuple[list[list[float, ...], ...], np.ndarray]:
+    """Performs online binpacking of `items` into bins of size `capacity`, like
+    `online_binpack` with `num_items` empty bins, but only simulating the opened bins.
+
+    The unused bins of `online_binpack` are identical, so only the first of them
+    matters: the candidates of an item are the opened bins it fits in, in the
+    order they were opened, followed by one empty bin. The remaining capacities
+    live in a growable array, so the cost of an item scales with the number of
+    opened bins instead of the number of items.
+
+    Returns the packing and the remaining capacities of the opened bins.
+    """
+    bins = np.full(64, capacity)
+    count = 1  # Opened bins, followed by the empty bin.
+    packing = [[]]
+    for item in items:
+        # Extract bins that have sufficient space to fit item.
+        valid_bin_indices = get_valid_bin_indices(item, bins[:count])
+        # Score each bin based on heuristic.
+        priorities = priority(item, bins[valid_bin_indices])
+        # Add item to bin with highest priority.
+        best_bin = valid_bin_indices[np.argmax(priorities)]
+        bins[best_bin] -= item
+        packing[best_bin].append(item)
+        if best_bin == count - 1:
+            # The empty bin was opened: add a new empty bin.
+            if count == len(bins):
+                bins = np.concatenate([bins, np.full(len(bins), capacity)])
+            count += 1
+            packing.append([])
+    return packing[:-1], bins[:count - 1]
+
+
+class StreamingBinPacker:
+    """Online binpacking of a stream of items, fed in chunks, into bins of size `capacity`, in memory bounded by the
+    number of open bins instead of the length of the stream.
+
+    The bins are those of `online_binpack_open_bins` minus the closed ones, which are only counted:
+    - a bin whose remaining capacity is below `min_item` is closed, as no item fits it anymore (so the packing is
+      the same as `online_binpack_open_bins` if every item is at least `min_item`);
+    - with `max_open_bins`, the open bin with the least remaining capacity is closed before another bin is opened
+      (bounded-space online binpacking, whose packing can use more bins than the unbounded one).
+    The items of the open bins are only kept with `validate`, which checks every closed bin and `check` the totals.
+    """
+
+    def __init__(self, capacity: float, max_open_bins: int = None, min_item: float = 0.0,
+                 validate: bool = False) -> None:
+        self.capacity = capacity
+        self.max_open_bins = max_open_bins
+        self.min_item = min_item
+        self.bins = np.full(64 if max_open_bins is None else max_open_bins + 1, float(capacity))
+        self.count = 1  # Open bins, followed by the empty bin.
+        self.packing = [[]] if validate else None
+        self.closed_bins = 0
+        self.num_items = 0
+        self.total_size = 0.0
+        self.packed_items = 0  # Items and total size of the checked closed bins
+        self.packed_size = 0.0
+
+    def close(self, index: int) -> None:
+        self.closed_bins += int(self.bins[index] != self.capacity)
+        if self.packing is not None:
+            bin_items = self.packing.pop(index)
+            if sum(bin_items) > self.capacity:
+                raise ValueError(f"Bin of size {self.capacity} packed with {sum(bin_items)}")
+            self.packed_items += len(bin_items)
+            self.packed_size += sum(bin_items)
+        self.bins[index:self.count - 1] = self.bins[index + 1:self.count]
+        self.count -= 1
+        self.bins[self.count] = self.capacity
+
+    def add_empty_bin(self) -> None:
+        """Adds an empty bin after the open bins `bins[:count]`."""
+        if self.max_open_bins is not None and self.count > self.max_open_bins:
+            self.close(int(np.argmin(self.bins[:self.count])))
+        elif self.count == len(self.bins):
+            self.bins = np.concatenate([self.bins, np.full(len(self.bins), float(self.capacity))])
+        self.bins[self.count] = self.capacity
+        self.count += 1
+        if self.packing is not None:
+            self.packing.append([])
+
+    def pack(self, items: np.ndarray) -> None:
+        """Packs the next chunk of items."""
+        self.num_items += len(items)
+        self.total_size += float(np.sum(items))
+        for item in items:
+            bins = self.bins[:self.count]
+            # Extract bins that have sufficient space to fit item.
+            valid_bin_indices = get_valid_bin_indices(item, bins)
+            # Score each bin based on heuristic.
+            priorities = priority(item, bins[valid_bin_indices])
+            # Add item to bin with highest priority.
+            best_bin = valid_bin_indices[np.argmax(priorities)]
+            self.bins[best_bin] -= item
+            if self.packing is not None:
+                self.packing[best_bin].append(item)
+            opened = best_bin == self.count - 1
+            if self.bins[best_bin] < self.min_item:
+                self.close(best_bin)
+            if opened:
+                # The empty bin was opened (and possibly closed): add a new empty bin.
+                self.add_empty_bin()
+
+    @property
+    def bins_used(self) -> int:
+        return self.closed_bins + int((self.bins[:self.count - 1] != self.capacity).sum())
+
+    @property
+    def l1_bound(self) -> float:
+        return float(np.ceil(self.total_size / self.capacity))
+
+    @property
+    def excess(self) -> float:
+        """Excess of the bins used over the L1 lower bound of the items so far, in percent."""
+        return 100 * (self.bins_used - self.l1_bound) / self.l1_bound if self.l1_bound else 0.0
+
+    def check(self) -> None:
+        """With `validate`, checks that the bins hold every item packed so far, within their capacity."""
+        if self.packing is None:
+            return
+        open_bins = self.packing[:-1]
+        if any(sum(bin_items) > self.capacity for bin_items in open_bins):
+            raise ValueError(f"Open bin of size {self.capacity} overpacked")
+        packed_items = self.packed_items + sum(len(bin_items) for bin_items in open_bins)
+        packed_size = self.packed_size + sum(sum(bin_items) for bin_items in open_bins)
+        if packed_items != self.num_items or not np.isclose(packed_size, self.total_size):
+            raise ValueError(f"{packed_items} items of total size {packed_size} packed, "
+                             f"out of {self.num_items} items of total size {self.total_size}")
+
+
+def item_chunks(source, chunk_size: int = 65536):
+    """Yields the items of `source` as float arrays of at most `chunk_size` items. `source` is the path of a .npy
+    file, which is memory-mapped, an array, or an iterable of items or of arrays of items (e.g. a generator)."""
+    if isinstance(source, str):
+        source = np.load(source, mmap_mode='r')
+    if isinstance(source, np.ndarray):
+        for start in range(0, len(source), chunk_size):
+            yield np.asarray(source[start:start + chunk_size], dtype=float)
+        return
+    buffer = []
+    for items in source:
+        if np.ndim(items) == 0:
+            buffer.append(items)
+            if len(buffer) == chunk_size:
+                yield np.array(buffer, dtype=float)
+                buffer = []
+            continue
+        if buffer:
+            yield np.array(buffer, dtype=float)
+            buffer = []
+        yield from item_chunks(np.asarray(items), chunk_size)
+    if buffer:
+        yield np.array(buffer, dtype=float)
+
+
+def evaluate_stream(chunks, capacity: float, max_open_bins: int = None, min_item: float = 0.0,
+                    validate: bool = False, report_every: int = 100000) -> StreamingBinPacker:
+    """Packs the item `chunks` in a `StreamingBinPacker`, printing the bins used and the L1 excess every
+    `report_every` items (at the end of a chunk)."""
+    packer = StreamingBinPacker(capacity, max_open_bins, min_item, validate)
+    start_time = time.perf_counter()
+    reported = 0
+    for chunk in chunks:
+        packer.pack(chunk)
+        if packer.num_items - reported >= report_every:
+            reported = packer.num_items
+            print(f'\t {packer.num_items} items: {packer.bins_used} bins, L1 bound {packer.l1_bound:.0f}, '
+                  f'excess {packer.excess:.2f}% ({time.perf_counter() - start_time:.1f}s)', flush=True)
+    packer.check()
+    return packer
+
+
+def pack_instance(instance: dict) -> tuple[int, float]:
+    """Returns the number of bins used to pack `instance` and the time it took."""
+    start_time = time.perf_counter()
+    capacity = instance['capacity']
+    items = instance['items']
+    items = np.array(items) if isinstance(items, list) else items
+    # Pack items into bins and return remaining capacity in bins_packed, which
+    # has one entry per opened bin (see online_binpack_open_bins).
+    _, bins_packed = online_binpack_open_bins(items.astype(float), capacity)
+    # If remaining capacity in a bin is equal to initial capacity, then it is
+    # unused. Count number of used bins.
+    return int((bins_packed != capacity).sum()), time.perf_counter() - start_time
+
+
+# Default bound on the open bins of the streaming mode, which bounds its memory and the cost of an item.
+STREAM_MAX_OPEN_BINS = 1024
+
+
+# Instances of the pool workers, inherited when they are forked.
+_pool_instances = {}
+
+
+def _on_instance_timeout(signum, frame):
+    # Not an Exception, so that the heuristic cannot swallow it
+    raise EvaluationTimeout("The packing of this instance timed out")
+
+
+def _pack_pool_instance(name: str, timeout: float) -> tuple[int, float]:
+    if timeout:
+        signal.signal(signal.SIGALRM, _on_instance_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return pack_instance(_pool_instances[name])
+    except EvaluationTimeout as e:
+        # Pool workers only send Exceptions back to the parent
+        raise TimeoutError(str(e)) from None
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def pack_instances(instances: dict, selected: list, workers: int, timeout: float):
+    """Yields the index, number of bins and time of each of the `selected`
+    (index, name) instances, in order, packed by `workers` forked processes,
+    each instance within `timeout` seconds if given."""
+    if workers <= 1 and timeout is None:
+        for index, name in selected:
+            yield index, *pack_instance(instances[name])
+        return
+    global _pool_instances
+    _pool_instances = instances
+    pool = multiprocessing.get_context("fork").Pool(workers)
+    try:
+        results = [(index, pool.apply_async(_pack_pool_instance, (name, timeout))) for index, name in selected]
+        for index, result in results:
+            try:
+                bins_used, elapsed = result.get()
+            except TimeoutError as e:
+                report_timeout(str(e))  # Not a failure of the heuristic, to evaluate again
+                raise
+            yield index, bins_used, elapsed
+    finally:
+        pool.terminate()
+
+
 def evaluate(instances: dict) -> float:
     """Evaluate heuristic function on a set of online binpacking instances."""
     # List storing number of bins used for each instance.
     num_bins = []
-    # Perform online binpacking for each instance.
-    for name in instances:
-        if name == 'l1_bound':
-            continue
-        instance = instances[name]
-        capacity = instance['capacity']
-        items = instance['items']
-        items = np.array(items) if isinstance(items, list) else items
-        # Create num_items bins so there will always be space for all items,
-        # regardless of packing order. Array has shape (num_items,).
-        bins = np.array([capacity for _ in range(instance['num_items'])])
-        # Pack items into bins and return remaining capacity in bins_packed, which
-        # has shape (num_items,).
-        _, bins_packed = online_binpack(items.astype(float), bins)
-        # If remaining capacity in a bin is equal to initial capacity, then it is
-        # unused. Count number of used bins.
-        num_bins.append((bins_packed != capacity).sum())
+    # Perform online binpacking for each instance (of the slice selected for this run), in parallel.
+    names = [name for name in instances if name != 'l1_bound']
+    selected = list(select_instances(enumerate(names)))
+    l1_bound = instances['l1_bound']
+    for index, bins_used, elapsed in pack_instances(instances, selected, instance_workers(len(selected)),
+                                                    instance_timeout()):
+        num_bins.append(bins_used)
+        # Report the excess of the instance, whose mean over instances is the objective of the dataset.
+        report_instance(index, 100 * (bins_used - l1_bound) / l1_bound, time=elapsed)
     # Score of heuristic function is negative of average number of bins used
     # across instances (as we want to minimize number of bins).
     return -np.mean(num_bins)
@@ -95,7 +332,27 @@ if __name__ == "__main__":
     problem_size = int(sys.argv[1])
     root_dir = sys.argv[2] # reserved for compatibility
     mood = sys.argv[3]
-    assert mood in ['train', 'val']
+    assert mood in ['train', 'val', 'stream']
+
+    if mood == 'stream':
+        # Streaming benchmark: the items of the .npy file argv[4] (memory-mapped), or `problem_size` Weibull items
+        # generated in chunks, packed with at most argv[5] open bins (0 for no bound) and validated if argv[6] is set.
+        from gen_inst import bin_capacity, weibull_item_chunks
+        source = sys.argv[4] if len(sys.argv) > 4 and sys.argv[4] != '-' else None
+        max_open_bins = int(sys.argv[5]) if len(sys.argv) > 5 else STREAM_MAX_OPEN_BINS
+        validate = len(sys.argv) > 6 and sys.argv[6].lower() in ['1', 'true', 'validate']
+        chunks = item_chunks(source) if source else weibull_item_chunks(problem_size)
+        packer = evaluate_stream(chunks, bin_capacity, max_open_bins or None, min_item=1, validate=validate)
+        print(source or f"weibull_{problem_size}_stream")
+        print(f'\t Number of items: {packer.num_items}')
+        print(f'\t Number of bins: {packer.bins_used}')
+        print(f'\t Lower bound on optimum: {packer.l1_bound}')
+        print(f'\t Excess: {packer.excess:.2f}%')
+        print("[*] Average:")
+        print(packer.excess)
+        report_result(packer.excess)
+        sys.exit(0)
+
     assert problem_size in [5000, -1]
     
     file_name = f"weibull_5k_{mood}.pickle"
@@ -106,7 +363,8 @@ if __name__ == "__main__":
         from gen_inst import generate_datasets
         generate_datasets()
     
-    dataset = pickle.load(open(dataset_path, 'rb'))
+    from gen_inst import load_dataset
+    dataset = load_dataset(dataset_path)
     
     # Evaluate heuristic function on dataset
     avg_num_bins = -evaluate(dataset)
@@ -118,4 +376,5 @@ if __name__ == "__main__":
     print(f'\t Excess: {100 * excess:.2f}%')
     
     print("[*] Average:")
-    print(excess * 100)
\ No newline at end of file
+    print(excess * 100)
+    report_result(excess * 100)
\ No newline at end of file
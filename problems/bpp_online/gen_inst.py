@@ -23,6 +23,15 @@ def generate_weibull_instances(num_instances, num_items, shape, scale, max_size)
     return instances
 
 
+def weibull_item_chunks(num_items, chunk_size=65536, shape=shape_param, scale=scale_param, max_size=max_item_size,
+                        seed=None):
+    """Yields `num_items` items of the Weibull instances in chunks of `chunk_size`, for streams too long to hold."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_items, chunk_size):
+        samples = rng.weibull(shape, min(chunk_size, num_items - start)) * scale
+        yield np.round(np.clip(samples, None, max_size)).astype(int)
+
+
 def l1_bound(items: tuple[int, ...], capacity: int) -> float:
   """Computes L1 lower bound on OPT for bin packing.
 
@@ -51,6 +60,26 @@ def l1_bound_dataset(instances: dict) -> float:
     l1_bounds.append(l1_bound(instance['items'], instance['capacity']))
   return np.mean(l1_bounds)
 
+def load_pickle(dataset_path):
+    """Fields and meta data of a pickled dataset, for the dataset store."""
+    dataset = pickle.load(open(dataset_path, 'rb'))
+    names = [name for name in dataset if name != 'l1_bound']
+    fields = {'capacity': np.array([dataset[name]['capacity'] for name in names]),
+              'items': [np.asarray(dataset[name]['items']) for name in names]}
+    return fields, {'names': names, 'l1_bound': float(dataset['l1_bound'])}
+
+
+def load_dataset(dataset_path) -> dict:
+    """Dataset of `dataset_path` as pickled, e.g {train_i: {capacity: 100, num_items: 5000, items: [...]}, ...,
+    l1_bound: ...}, the items being memory-mapped from the dataset store."""
+    from utils.dataset_store import open_dataset
+    split = open_dataset(dataset_path, load_pickle)
+    dataset = {name: {'capacity': capacity.item(), 'num_items': len(items), 'items': items}
+               for name, capacity, items in zip(split.meta['names'], split['capacity'], split['items'])}
+    dataset['l1_bound'] = split.meta['l1_bound']
+    return dataset
+
+
 def generate_datasets():
     basepath = os.path.dirname(__file__)
     os.makedirs(os.path.join(basepath, "dataset"), exist_ok=True)
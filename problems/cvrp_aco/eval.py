@@ -1,6 +1,7 @@
 import os
 from aco import ACO
 import sys
+import time
 import numpy as np
 from scipy.spatial import distance_matrix
 import logging
@@ -10,6 +11,8 @@ sys.path.insert(0, "../../../")
 
 import gpt
 from utils.utils import get_heuristic_name
+from utils.result_channel import report_instance, report_result, select_instances
+from utils.dataset_store import open_dataset
 
 
 possible_func_names = ["heuristics", "heuristics_v1", "heuristics_v2", "heuristics_v3"]
@@ -21,8 +24,17 @@ N_ITERATIONS = 100
 N_ANTS = 30
 CAPACITY = 50
 
-def solve(node_pos, demand):
-    dist_mat = distance_matrix(node_pos, node_pos)
+def instance_distances(instance):
+    # Rows of an instance are (demand, x, y)
+    return distance_matrix(instance[:, 1:], instance[:, 1:])
+
+def load_dataset(dataset_path):
+    """Demands, node positions and distance matrices of the instances, memory-mapped from the dataset store."""
+    split = open_dataset(dataset_path, derived={"distances": ("data", instance_distances)})
+    return split["data"][:, :, 0], split["data"][:, :, 1:], split["distances"]
+
+def solve(node_pos, demand, distances=None):
+    dist_mat = distance_matrix(node_pos, node_pos) if distances is None else np.array(distances)
     dist_mat[np.diag_indices_from(dist_mat)] = 1 # set diagonal to a large number
     if len(inspect.getfullargspec(heuristics).args) == 4:
         heu = heuristics(dist_mat.copy(), node_pos.copy(), demand.copy(), CAPACITY) + 1e-9
@@ -49,33 +61,34 @@ if __name__ == "__main__":
     
     if mood == 'train':
         dataset_path = os.path.join(basepath, f"dataset/{mood}{problem_size}_dataset.npy")
-        dataset = np.load(dataset_path)
-        demands, node_positions = dataset[:, :, 0], dataset[:, :, 1:]
+        demands, node_positions, distances = load_dataset(dataset_path)
         
         n_instances = node_positions.shape[0]
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i, (node_pos, demand) in enumerate(zip(node_positions, demands)):
-            obj = solve(node_pos, demand)
+        for i, (node_pos, demand) in select_instances(enumerate(zip(node_positions, demands))):
+            start_time = time.perf_counter()
+            obj = solve(node_pos, demand, distances[i])
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj.item())
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
         
     else:
         for problem_size in [20, 50, 100]:
             dataset_path = os.path.join(basepath, f"dataset/{mood}{problem_size}_dataset.npy")
-            dataset = np.load(dataset_path)
-            demands, node_positions = dataset[:, :, 0], dataset[:, :, 1:]
+            demands, node_positions, distances = load_dataset(dataset_path)
             
             n_instances = node_positions.shape[0]
             logging.info(f"[*] Evaluating {dataset_path}")
             
             objs = []
             for i, (node_pos, demand) in enumerate(zip(node_positions, demands)):
-                obj = solve(node_pos, demand)
+                obj = solve(node_pos, demand, distances[i])
                 objs.append(obj.item())
             
             print(f"[*] Average for {problem_size}: {np.mean(objs)}")
\ No newline at end of file
@@ -3,10 +3,13 @@ import numpy as np
 import torch
 import logging
 import sys
+import time
 sys.path.insert(0, "../../../")
 
 import gpt
 from utils.utils import get_heuristic_name
+from utils.result_channel import report_instance, report_result, select_instances
+from utils.dataset_store import open_dataset
 
 
 possible_func_names = ["heuristics", "heuristics_v1", "heuristics_v2", "heuristics_v3"]
@@ -47,32 +50,36 @@ if __name__ == "__main__":
     
     if mood == 'train':
         dataset_path = os.path.join(basepath, f"dataset/{mood}{problem_size}_dataset.npz")
-        dataset = np.load(dataset_path)
+        dataset = open_dataset(dataset_path)
         prizes, weights = dataset['prizes'], dataset['weights']
         n_instances = prizes.shape[0]
 
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i, (prize, weight) in enumerate(zip(prizes, weights)):
-            obj = solve(prize, weight)
+        for i, (prize, weight) in select_instances(enumerate(zip(prizes, weights))):
+            start_time = time.perf_counter()
+            # Writable copies of the memory-mapped instance, for torch
+            obj = solve(np.array(prize), np.array(weight))
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj.item())
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
 
     else: # mood == 'val'
         for problem_size in [100, 300, 500]:
             dataset_path = os.path.join(basepath, f"dataset/{mood}{problem_size}_dataset.npz")
-            dataset = np.load(dataset_path)
+            dataset = open_dataset(dataset_path)
             prizes, weights = dataset['prizes'], dataset['weights']
             n_instances = prizes.shape[0]
             logging.info(f"[*] Evaluating {dataset_path}")
 
             objs = []
             for i, (prize, weight) in enumerate(zip(prizes, weights)):
-                obj = solve(prize, weight)
+                obj = solve(np.array(prize), np.array(weight))
                 objs.append(obj.item())
             
             print(f"[*] Average for {problem_size}: {np.mean(objs)}")
\ No newline at end of file
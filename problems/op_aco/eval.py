@@ -4,10 +4,12 @@ import logging
 from gen_inst import OPInstance, load_dataset
 import torch
 import sys
+import time
 sys.path.insert(0, "../../../")
 
 import gpt
 from utils.utils import get_heuristic_name
+from utils.result_channel import report_instance, report_result, select_instances
 
 
 possible_func_names = ["heuristics", "heuristics_v1", "heuristics_v2", "heuristics_v3"]
@@ -55,13 +57,16 @@ if __name__ == "__main__":
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i, instance in enumerate(dataset):
+        for i, instance in select_instances(enumerate(dataset)):
+            start_time = time.perf_counter()
             obj = solve(instance)
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj.item())
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
 
     else: # mood == 'val'
         for problem_size in [50, 100, 200]:
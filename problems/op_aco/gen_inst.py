@@ -57,16 +57,19 @@ def generate_datasets(basepath = None):
             generate_dataset(filepath, n, batch_size=5 if mood =='train' else 64)
 
 def load_dataset(fp) -> list[OPInstance]:
-    data = np.load(fp)
-    coordinates = data['coordinates']
+    # Coordinates, distance matrices and prizes from the dataset store, copied to writable tensors
+    from utils.dataset_store import open_dataset
+    split = open_dataset(fp, derived={
+        'distance': ('coordinates', lambda coord: gen_distance_matrix(torch.from_numpy(np.array(coord))).numpy()),
+        'prize': ('coordinates', lambda coord: gen_prizes(torch.from_numpy(np.array(coord))).numpy()),
+    })
+    coordinates = split['coordinates']
     instances = []
     n = coordinates[0].shape[0]
     maxlen = get_max_len(n)
-    for coord_np in coordinates:
-        coord = torch.from_numpy(coord_np)
-        distance = gen_distance_matrix(coord)
-        prize = gen_prizes(coord)
-        instance = OPInstance(n, coord, distance, prize, maxlen)
+    for coord_np, distance, prize in zip(coordinates, split['distance'], split['prize']):
+        coord = torch.from_numpy(np.array(coord_np))
+        instance = OPInstance(n, coord, torch.from_numpy(np.array(distance)), torch.from_numpy(np.array(prize)), maxlen)
         instances.append(instance)
     return instances
 
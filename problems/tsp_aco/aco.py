@@ -51,11 +51,11 @@ class ACO():
             costs: torch tensor with shape (n_ants,)
         '''
         self.pheromone = self.pheromone * self.decay 
-        for i in range(self.n_ants):
-            path = paths[:, i]
-            cost = costs[i]
-            self.pheromone[path, torch.roll(path, shifts=1)] += 1.0/cost
-            self.pheromone[torch.roll(path, shifts=1), path] += 1.0/cost
+        # Both directions of every edge of every ant, in one accumulating scatter
+        prev = torch.roll(paths, shifts=1, dims=0)
+        deposit = (1.0/costs).expand_as(paths)
+        self.pheromone.index_put_((torch.cat([paths, prev]).flatten(), torch.cat([prev, paths]).flatten()),
+                                  torch.cat([deposit, deposit]).flatten(), accumulate=True)
 
     @torch.no_grad()
     def gen_path_costs(self, paths):
@@ -114,4 +114,125 @@ class ACO():
         dist = Categorical(dist)
         actions = dist.sample() # shape: (n_ants,)
         log_probs = dist.log_prob(actions) if require_prob else None # shape: (n_ants,)
-        return actions, log_probs
\ No newline at end of file
+        return actions, log_probs
+
+
+class BatchedACO():
+    """
+    ACO of a batch of TSP instances of the same size, like `ACO` run on each of them: the tensors have a leading
+    batch dimension (instances x ants for the tours), all the ants of all the instances move at each step, and the
+    pheromone of all the ants is deposited in one scatter.
+    """
+
+    def __init__(self, 
+                 distances,  # (batch, n, n)
+                 heuristic,  # (batch, n, n)
+                 n_ants=30, 
+                 decay=0.9,
+                 alpha=1,
+                 beta=1,
+                 device='cpu'
+                 ):
+        
+        self.distances = torch.as_tensor(distances, device=device)
+        self.batch_size, self.problem_size = self.distances.shape[:2]
+        self.n_ants = n_ants
+        self.decay = decay
+        self.alpha = alpha
+        self.beta = beta
+        
+        self.pheromone = torch.ones_like(self.distances)
+        self.heuristic = torch.as_tensor(heuristic, device=device)
+
+        self.shortest_path = None  # (batch, problem_size)
+        self.lowest_cost = torch.full((self.batch_size,), float('inf'), dtype=self.distances.dtype, device=device)
+
+        self.device = device
+        self.instances = torch.arange(self.batch_size, device=device)[:, None]  # (batch, 1), indexes the batch
+
+    @torch.no_grad()
+    def run(self, n_iterations):
+        '''
+        Returns:
+            Lowest cost of each instance: torch tensor with shape (batch,)
+        '''
+        for _ in range(n_iterations):
+            paths = self.gen_path()
+            costs = self.gen_path_costs(paths)
+            
+            best_cost, best_idx = costs.min(dim=1)
+            best_path = paths[self.instances[:, 0], best_idx]
+            improved = best_cost < self.lowest_cost
+            self.shortest_path = best_path if self.shortest_path is None else torch.where(
+                improved[:, None], best_path, self.shortest_path)
+            self.lowest_cost = torch.where(improved, best_cost, self.lowest_cost)
+            
+            self.update_pheronome(paths, costs)
+
+        return self.lowest_cost
+
+    @torch.no_grad()
+    def update_pheronome(self, paths, costs):
+        '''
+        Args:
+            paths: torch tensor with shape (batch, n_ants, problem_size)
+            costs: torch tensor with shape (batch, n_ants)
+        '''
+        self.pheromone = self.pheromone * self.decay 
+        prev = torch.roll(paths, shifts=1, dims=2)
+        instances = self.instances[:, :, None].expand_as(paths)
+        deposit = (1.0/costs)[:, :, None].expand_as(paths)
+        self.pheromone.index_put_((torch.cat([instances, instances]).flatten(), torch.cat([paths, prev]).flatten(),
+                                   torch.cat([prev, paths]).flatten()),
+                                  torch.cat([deposit, deposit]).flatten(), accumulate=True)
+
+    @torch.no_grad()
+    def gen_path_costs(self, paths):
+        '''
+        Args:
+            paths: torch tensor with shape (batch, n_ants, problem_size)
+        Returns:
+                Lengths of paths: torch tensor with shape (batch, n_ants)
+        '''
+        assert paths.shape == (self.batch_size, self.n_ants, self.problem_size)
+        lengths = self.distances[self.instances[:, :, None], paths, torch.roll(paths, shifts=1, dims=2)]
+        assert (lengths > 0).all()
+        return torch.sum(lengths, dim=2)
+
+    @torch.no_grad()
+    def gen_path(self):
+        '''
+        Tour contruction for all ants of all instances
+        Returns:
+            paths: torch tensor with shape (batch, n_ants, problem_size), paths[b, i] is the tour of the ith ant of
+            instance b
+        '''
+        start = torch.randint(low=0, high=self.problem_size, size=(self.batch_size, self.n_ants), device=self.device)
+        mask = torch.ones(size=(self.batch_size, self.n_ants, self.problem_size), device=self.device)
+        mask.scatter_(2, start[:, :, None], 0)
+        # The move weights only depend on the pheromone, which is constant during the construction
+        weights = (self.pheromone ** self.alpha) * (self.heuristic ** self.beta) # shape: (batch, p_size, p_size)
+        
+        paths_list = [start] # paths_list[i] is the ith move (tensor) for all ants
+        prev = start
+        for _ in range(self.problem_size-1):
+            actions = self.pick_move(weights, prev, mask)
+            paths_list.append(actions)
+            prev = actions
+            mask.scatter_(2, actions[:, :, None], 0)
+        return torch.stack(paths_list, dim=2)
+        
+    def pick_move(self, weights, prev, mask):
+        '''
+        Args:
+            weights: tensor with shape (batch, p_size, p_size), move weights of the instances
+            prev: tensor with shape (batch, n_ants), previous nodes for all ants
+            mask: tensor with shape (batch, n_ants, p_size), masks (0) for the visited cities
+        '''
+        dist = weights[self.instances, prev] * mask # shape: (batch, n_ants, p_size)
+        # Sample Categorical(dist) by inverting its cumulative weights: the first node whose cumulative weight
+        # exceeds a uniform draw below the total, which is an unvisited one.
+        cumulative = dist.cumsum(dim=2)
+        total = cumulative[:, :, -1:]
+        draw = torch.minimum(torch.rand_like(total) * total, torch.nextafter(total, torch.zeros_like(total)))
+        return torch.searchsorted(cumulative, draw, right=True).squeeze(2) # shape: (batch, n_ants)
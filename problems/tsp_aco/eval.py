@@ -1,6 +1,7 @@
 from os import path
-from aco import ACO
+from aco import ACO, BatchedACO
 import sys
+import time
 import numpy as np
 from scipy.spatial import distance_matrix
 import logging
@@ -9,6 +10,8 @@ sys.path.insert(0, "../../../")
 
 import gpt
 from utils.utils import get_heuristic_name
+from utils.result_channel import report_instance, report_result, select_instances
+from utils.dataset_store import open_dataset
 
 
 possible_func_names = ["heuristics", "heuristics_v1", "heuristics_v2", "heuristics_v3"]
@@ -20,15 +23,45 @@ N_ITERATIONS = 100
 N_ANTS = 30
 
 
-def solve(node_pos):
-    dist_mat = distance_matrix(node_pos, node_pos)
+def node_distances(node_pos):
+    return distance_matrix(node_pos, node_pos)
+
+def load_dataset(dataset_path):
+    """Node positions and distance matrices of the instances, memory-mapped from the dataset store."""
+    split = open_dataset(dataset_path, derived={"distances": ("data", node_distances)})
+    return split["data"], split["distances"]
+
+def prepare(node_pos, distances=None):
+    dist_mat = node_distances(node_pos) if distances is None else np.array(distances)
     dist_mat[np.diag_indices_from(dist_mat)] = 1 # set diagonal to a large number
     heu = heuristics(dist_mat.copy()) + 1e-9
     heu[heu < 1e-9] = 1e-9
+    return dist_mat, heu
+
+def solve(node_pos, distances=None):
+    dist_mat, heu = prepare(node_pos, distances)
     aco = ACO(dist_mat, heu, n_ants=N_ANTS)
     obj = aco.run(N_ITERATIONS)
     return obj
 
+def solve_batch(node_positions, distances):
+    """Objectives of instances of the same size, solved together by BatchedACO, and the share of the time spent on
+    each of them: its heuristic plus an equal share of the ACO, which solves all of them at once."""
+    if not len(node_positions):
+        return [], []
+    dist_mats, heus, times = [], [], []
+    for node_pos, dist in zip(node_positions, distances):
+        start_time = time.perf_counter()
+        dist_mat, heu = prepare(node_pos, dist)
+        dist_mats.append(dist_mat)
+        heus.append(heu)
+        times.append(time.perf_counter() - start_time)
+    start_time = time.perf_counter()
+    aco = BatchedACO(np.stack(dist_mats), np.stack(heus), n_ants=N_ANTS)
+    objs = aco.run(N_ITERATIONS).tolist()
+    share = (time.perf_counter() - start_time) / len(objs)
+    return objs, [elapsed + share for elapsed in times]
+
 if __name__ == "__main__":
     print("[*] Running ...")
 
@@ -44,27 +77,28 @@ if __name__ == "__main__":
     
     if mood == 'train':
         dataset_path = path.join(basepath, f"{mood}{problem_size}_dataset.npy")
-        node_positions = np.load(dataset_path)
+        node_positions, distances = load_dataset(dataset_path)
         n_instances = node_positions.shape[0]
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
-        objs = []
-        for i, node_pos in enumerate(node_positions):
-            obj = solve(node_pos)
+        # The selected instances (the racing slice, if any) are solved in one batch, and reported once it is done
+        indices = [i for i, _ in select_instances(enumerate(node_positions))]
+        start_time = time.perf_counter()
+        objs, times = solve_batch([node_positions[i] for i in indices], [distances[i] for i in indices])
+        batch_time = time.perf_counter() - start_time
+        for i, obj, share in zip(indices, objs, times):
             print(f"[*] Instance {i}: {obj}")
-            objs.append(obj)
+            report_instance(i, obj, start_time, time=share, batch_time=batch_time)
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
     
     else:
         for problem_size in [20, 50, 100]:
             dataset_path = path.join(basepath, f"{mood}{problem_size}_dataset.npy")
-            node_positions = np.load(dataset_path)
+            node_positions, distances = load_dataset(dataset_path)
             logging.info(f"[*] Evaluating {dataset_path}")
             n_instances = node_positions.shape[0]
-            objs = []
-            for i, node_pos in enumerate(node_positions):
-                obj = solve(node_pos)
-                objs.append(obj.item())
+            objs, _ = solve_batch(node_positions, distances)
             print(f"[*] Average for {problem_size}: {np.mean(objs)}")
\ No newline at end of file
@@ -6,6 +6,11 @@ import argparse
 from scipy.spatial import distance_matrix
 import logging
 from copy import copy
+import time
+sys.path.insert(0, "../../../")
+
+from utils.result_channel import report_instance, report_result, select_instances
+from utils.dataset_store import open_dataset
 
 try:
     from gpt import select_next_node_v2 as select_next_node
@@ -13,7 +18,17 @@ except:
     from gpt import select_next_node
 
 
-def eval_heuristic(node_positions: np.ndarray) -> float:
+def node_distances(node_positions: np.ndarray) -> np.ndarray:
+    return distance_matrix(node_positions, node_positions)
+
+
+def load_dataset(dataset_path: str) -> tuple[np.ndarray, np.ndarray]:
+    """Node positions and distance matrices of the instances, memory-mapped from the dataset store."""
+    split = open_dataset(dataset_path, derived={"distances": ("data", node_distances)})
+    return split["data"], split["distances"]
+
+
+def eval_heuristic(node_positions: np.ndarray, distances: np.ndarray = None) -> float:
     '''
     Generate solution for TSP problem using the GPT-generated heuristic algorithm.
     
@@ -21,6 +36,8 @@ def eval_heuristic(node_positions: np.ndarray) -> float:
     ----------
     node_positions : np.ndarray
         2D array of node positions of shape (problem_size, 2).
+    distances : np.ndarray, optional
+        Distance matrix of the nodes, computed if not given.
     
     Returns
     -------
@@ -29,7 +46,7 @@ def eval_heuristic(node_positions: np.ndarray) -> float:
     '''
     problem_size = node_positions.shape[0]
     # calculate distance matrix
-    dist_mat = distance_matrix(node_positions, node_positions)
+    dist_mat = node_distances(node_positions) if distances is None else np.asarray(distances)
     # set the starting node
     start_node = 0
     solution = [start_node]
@@ -73,27 +90,30 @@ if __name__ == '__main__':
     
     if mood == 'train':
         dataset_path = path.join(basepath, f"train{problem_size}_dataset.npy")
-        node_positions = np.load(dataset_path)
+        node_positions, distances = load_dataset(dataset_path)
         n_instances = node_positions.shape[0]
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i in range(n_instances):
-            obj = eval_heuristic(node_positions[i])
+        for i, _ in select_instances(enumerate(node_positions)):
+            start_time = time.perf_counter()
+            obj = eval_heuristic(node_positions[i], distances[i])
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj)
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
     
     else:
         for problem_size in [20, 50, 100, 200]:
             dataset_path = path.join(basepath, f"val{problem_size}_dataset.npy")
             logging.info(f"[*] Evaluating {dataset_path}")
-            node_positions = np.load(dataset_path)
+            node_positions, distances = load_dataset(dataset_path)
             n_instances = node_positions.shape[0]
             objs = []
             for i in range(n_instances):
-                obj = eval_heuristic(node_positions[i])
+                obj = eval_heuristic(node_positions[i], distances[i])
                 objs.append(obj)
             print(f"[*] Average for {problem_size}: {np.mean(objs)}")
\ No newline at end of file
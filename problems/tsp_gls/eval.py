@@ -3,6 +3,11 @@ import logging
 from gen_inst import TSPInstance, load_dataset, dataset_conf
 from gls import guided_local_search
 from tqdm import tqdm
+import sys
+import time
+sys.path.insert(0, "../../../")
+
+from utils.result_channel import report_instance, report_result, select_instances
 
 try:
     from gpt import update_edge_distance_v2 as heuristics
@@ -46,13 +51,16 @@ if __name__ == "__main__":
         print(f"[*] Dataset loaded: {dataset_path} with {n_instances} instances.")
         
         objs = []
-        for i, instance in enumerate(dataset):
+        for i, instance in select_instances(enumerate(dataset)):
+            start_time = time.perf_counter()
             obj = solve(instance)
             print(f"[*] Instance {i}: {obj}")
+            report_instance(i, obj, start_time)
             objs.append(obj)
         
         print("[*] Average:")
         print(np.mean(objs))
+        report_result(np.mean(objs))
 
     else: # mood == 'val'
         for problem_size in dataset_conf['val']:
@@ -3,10 +3,13 @@ import numpy.typing as npt
 from scipy.spatial import distance_matrix
 
 class TSPInstance:
-    def __init__(self, positions: npt.NDArray[np.float_]) -> None:
+    def __init__(self, positions: npt.NDArray[np.float_], distmat: npt.NDArray[np.float_] = None) -> None:
         self.positions = positions
         self.n = positions.shape[0]
-        self.distmat = distance_matrix(positions, positions) + np.eye(self.n)*1e-5
+        self.distmat = instance_distmat(positions) if distmat is None else distmat
+
+def instance_distmat(positions: npt.NDArray[np.float_]) -> npt.NDArray[np.float_]:
+    return distance_matrix(positions, positions) + np.eye(positions.shape[0])*1e-5
     
 dataset_conf = {
     'train': (200,),
@@ -30,8 +33,10 @@ def generate_datasets(basepath = None):
             generate_dataset(filepath, n, batch_size=10 if mood =='train' else 64)
 
 def load_dataset(fp) -> list[TSPInstance]:
-    data = np.load(fp)
-    dataset = [TSPInstance(d) for d in data]
+    # Positions and distance matrices memory-mapped from the dataset store
+    from utils.dataset_store import open_dataset
+    split = open_dataset(fp, derived={'distmat': ('data', instance_distmat)})
+    dataset = [TSPInstance(d, distmat) for d, distmat in zip(split['data'], split['distmat'])]
     return dataset
 
 
@@ -0,0 +1,84 @@
+"""
+Generation-level checkpoints of the evolution algorithms (HSEvo, HSEvo_QD, ReEvo, ReEvo_QD).
+
+A checkpoint holds the whole state of the algorithm object (population, elitist, reflections, token and
+evaluation counters, harmony search state, ...) and of the `random` and `numpy.random` generators, as a gzipped
+pickle. The configuration and the evaluation pool and cache are not saved; they come from the resumed run.
+The embeddings of the individuals are stored as float32 arrays (converted in a copy of the state, the running
+population keeps its own). The file is replaced atomically, so a run killed while checkpointing
+keeps its previous checkpoint.
+"""
+import copy
+import gzip
+import logging
+import os
+import pickle
+import random
+
+import numpy as np
+
+CHECKPOINT_FILE = "checkpoint.pkl.gz"
+CHECKPOINT_VERSION = 1
+
+# Attributes set from the configuration of the resumed run, or holding processes and connections
+RESOURCES = {"cfg", "root_dir", "prompt_dir", "eval_pool", "eval_cache", "embedding_service"}
+
+
+def _embeddings(value, seen: set):
+    """Embeddings of the individuals (dicts with a "code" key) found in an attribute value, including in the
+    containers and objects (e.g. archives) it holds."""
+    if id(value) in seen:
+        return
+    if isinstance(value, dict):
+        seen.add(id(value))
+        if "code" in value and value.get("embedding") is not None:
+            yield value["embedding"]
+        for item in value.values():
+            yield from _embeddings(item, seen)
+    elif isinstance(value, (list, tuple, set)):
+        seen.add(id(value))
+        for item in value:
+            yield from _embeddings(item, seen)
+    elif hasattr(value, "__dict__") and not callable(value):
+        seen.add(id(value))
+        yield from _embeddings(vars(value), seen)
+
+
+def checkpoint_path(resume: str, root_dir: str) -> str:
+    """Checkpoint file designated by `resume`: a checkpoint file, or a run directory, relative to `root_dir`."""
+    path = os.path.join(root_dir, resume)
+    return os.path.join(path, CHECKPOINT_FILE) if os.path.isdir(path) else path
+
+
+def save_checkpoint(algorithm, path: str = CHECKPOINT_FILE) -> None:
+    state = {name: value for name, value in vars(algorithm).items() if name not in RESOURCES}
+    # Copy the state with float32 embeddings: the copy of each embedding is given in the memo
+    seen = set()
+    memo = {id(embedding): np.asarray(embedding, dtype=np.float32)
+            for value in state.values() for embedding in _embeddings(value, seen)}
+    state = copy.deepcopy(state, memo)
+    checkpoint = {"version": CHECKPOINT_VERSION, "algorithm": type(algorithm).__name__, "state": state,
+                  "random": random.getstate(), "numpy_random": np.random.get_state()}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as file:
+        with gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6) as gzip_file:
+            pickle.dump(checkpoint, gzip_file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    logging.info(f"Checkpoint saved to {os.path.abspath(path)}")
+
+
+def load_checkpoint(algorithm, path: str) -> None:
+    """Restore the state saved by `save_checkpoint` into `algorithm`, an instance of the same class."""
+    with gzip.open(path, 'rb') as file:
+        checkpoint = pickle.load(file)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {checkpoint.get('version')}")
+    if checkpoint["algorithm"] != type(algorithm).__name__:
+        raise ValueError(f"Checkpoint of {checkpoint['algorithm']} cannot be resumed by {type(algorithm).__name__}")
+    vars(algorithm).update(checkpoint["state"])
+    random.setstate(checkpoint["random"])
+    np.random.set_state(checkpoint["numpy_random"])
+    logging.info(f"Resumed from {os.path.abspath(path)} at generation {algorithm.generation}, "
+                 f"iteration {algorithm.iteration}")
@@ -0,0 +1,133 @@
+"""
+Memory-mapped dataset store shared by the problem evaluators.
+
+Each dataset split is written once, on first use, to a directory next to its source file
+(`<dataset dir>/store/<file name>/`): one .npy file per field plus an index.json. The evaluators open the arrays
+with `np.load(mmap_mode='r')`, so the processes evaluating on the same split share them through the page cache
+instead of each loading the source (pickle, .npz...) and recomputing derived data such as distance matrices.
+
+- Ragged fields (lists of arrays of different lengths) are stored concatenated, with their offsets.
+- Derived fields are computed instance by instance into a memory-mapped file, so writing them does not hold the
+  whole field in memory either.
+- The store is rewritten when the source file changes (size or modification time), or its derived fields or
+  `version` do. Concurrent writers each write to a temporary directory, and the first one renamed wins.
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+INDEX = "index.json"
+STORE = "store"  # Directory of the store in the dataset directory, generated and left out of problem fingerprints
+
+
+def store_path(source_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(source_path)), STORE, os.path.basename(source_path))
+
+
+def load_arrays(source_path: str) -> tuple[dict, dict]:
+    """Fields of a .npy file (its array, as "data") or of a .npz file (its arrays), without meta data."""
+    data = np.load(source_path)
+    if isinstance(data, np.ndarray):
+        return {"data": data}, {}
+    with data:
+        return {name: data[name] for name in data.files}, {}
+
+
+def stored_key(path: str) -> dict:
+    try:
+        with open(os.path.join(path, INDEX), 'r') as f:
+            return json.load(f)["key"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class DatasetSplit:
+    """A split of the store, opened read-only and memory-mapped."""
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, INDEX), 'r') as f:
+            self.index = json.load(f)
+        self.meta = self.index["meta"]
+        self.arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                       for name in self.index["fields"]}
+        self.offsets = {name: np.load(os.path.join(path, f"{name}.offsets.npy")) for name in self.index["ragged"]}
+
+    def __len__(self) -> int:
+        return self.index["instances"]
+
+    def __contains__(self, field: str) -> bool:
+        return field in self.arrays
+
+    def __getitem__(self, field: str):
+        """The memory-mapped array of `field`, or the list of its rows (views) for a ragged field."""
+        values = self.arrays[field]
+        if field not in self.offsets:
+            return values
+        offsets = self.offsets[field]
+        return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def write_split(path: str, fields: dict, meta: dict = None, derived: dict = None, key: dict = None) -> None:
+    """
+    Write the split of `fields` (arrays, or lists of arrays for ragged fields) to `path`. `derived` maps field names
+    to (field, function): row i of the derived field is `function(row i of field)`.
+    """
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(temporary)
+    try:
+        ragged = []
+        instances = None
+        for name, value in fields.items():
+            if isinstance(value, (list, tuple)):
+                ragged.append(name)
+                np.save(os.path.join(temporary, f"{name}.offsets.npy"),
+                        np.concatenate([[0], np.cumsum([len(row) for row in value])]).astype(np.int64))
+                value = np.concatenate([np.asarray(row) for row in value]) if value else np.empty(0)
+                count = len(fields[name])
+            else:
+                value = np.ascontiguousarray(value)
+                count = len(value)
+            np.save(os.path.join(temporary, f"{name}.npy"), value)
+            instances = count if instances is None else instances
+
+        for name, (field, function) in (derived or {}).items():
+            rows = np.load(os.path.join(temporary, f"{field}.npy"), mmap_mode='r')
+            first = np.asarray(function(rows[0]))
+            out = np.lib.format.open_memmap(os.path.join(temporary, f"{name}.npy"), mode='w+', dtype=first.dtype,
+                                            shape=(len(rows), *first.shape))
+            out[0] = first
+            for i in range(1, len(rows)):
+                out[i] = function(rows[i])
+            out.flush()
+            del out
+
+        with open(os.path.join(temporary, INDEX), 'w') as f:
+            json.dump({"instances": instances or 0, "fields": list(fields) + list(derived or {}), "ragged": ragged,
+                       "meta": meta or {}, "key": key or {}}, f)
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            if stored_key(path) == key:
+                return  # Written concurrently by another process
+            shutil.rmtree(path, ignore_errors=True)  # Stale
+            os.rename(temporary, path)
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+def open_dataset(source_path: str, load=None, derived: dict = None, version: int = 1) -> DatasetSplit:
+    """
+    The split of the dataset file `source_path` in the store, written on first use. `load(source_path)` returns the
+    fields and meta data (a JSON-serializable dict) of the split, by default those of `load_arrays`; `derived` maps
+    names of derived fields to (field, function), as in `write_split`.
+    """
+    path = store_path(source_path)
+    stat = os.stat(source_path)
+    key = {"source": [stat.st_size, stat.st_mtime_ns], "derived": sorted(derived or {}), "version": version}
+    if stored_key(path) != key:
+        fields, meta = (load or load_arrays)(source_path)
+        write_split(path, fields, meta, derived, key)
+    return DatasetSplit(path)
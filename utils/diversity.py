@@ -0,0 +1,106 @@
+"""
+Shannon-Wiener Diversity Index (SWDI) and Cumulative Diversity Index (CDI) of the heuristics of a run.
+
+- SWDI of a generation: the heuristics evaluated during the iteration are clustered greedily by cosine similarity of
+  their embeddings (a heuristic joins the first cluster whose members are all more similar than `similarity`), and
+  SWDI = -sum(p_i log p_i), p_i being the share of the heuristics in cluster i.
+- CDI: over all the heuristics evaluated so far, CDI = -sum(p_i log p_i), p_i being the share of edge i in the total
+  length of the Euclidean minimum spanning tree of their L2-normalized embeddings.
+
+The minimum spanning tree is updated incrementally: the tree of the old and new points is a subset of the old tree
+and the edges from the new points, so an update only sorts those instead of all the pairs.
+"""
+import numpy as np
+
+from utils.qd_archive import EmbeddingArchive
+
+
+def entropy(weights: np.ndarray) -> float:
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights[weights > 0]
+    if weights.size == 0:
+        return 0.0
+    p = weights / weights.sum()
+    return float(-(p * np.log(p)).sum()) + 0.0  # Not -0.0 for a single cluster
+
+
+def swdi(embeddings: np.ndarray, similarity: float) -> float:
+    normalized = EmbeddingArchive.normalized_embeddings([{"embedding": e} for e in embeddings])
+    pairs = zip(*np.nonzero(np.triu(normalized @ normalized.T > similarity, 1)))
+    neighbors = {}
+    for i, j in pairs:
+        neighbors.setdefault(i, set()).add(j)
+        neighbors.setdefault(j, set()).add(i)
+    return entropy([len(cluster) for cluster in EmbeddingArchive.clusters(len(normalized), neighbors)])
+
+
+class IncrementalMST:
+    """Euclidean minimum spanning tree of a growing set of points."""
+
+    def __init__(self) -> None:
+        self.points = None  # float32, one row per point
+        self.edges = np.empty((0, 2), dtype=np.int64)
+        self.lengths = np.empty(0)
+
+    def add(self, points: np.ndarray) -> None:
+        points = np.asarray(points, dtype=np.float32)
+        old = 0 if self.points is None else len(self.points)
+        self.points = points if self.points is None else np.vstack([self.points, points])
+        count = len(self.points)
+
+        # Candidate edges: the old tree and every edge from a new point to a point before it
+        new = np.arange(old, count)
+        squared = (self.points ** 2).sum(axis=1)
+        distances = np.sqrt(np.maximum(squared[new, None] + squared[None, :] - 2 * points @ self.points.T, 0.0))
+        rows, columns = np.nonzero(np.arange(count)[None, :] < new[:, None])
+        edges = np.vstack([self.edges, np.column_stack([new[rows], columns])])
+        lengths = np.concatenate([self.lengths, distances[rows, columns]])
+
+        # Kruskal
+        parent = list(range(count))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        kept = []
+        for index in np.argsort(lengths, kind="stable"):
+            a, b = find(edges[index, 0]), find(edges[index, 1])
+            if a != b:
+                parent[a] = b
+                kept.append(index)
+                if len(kept) == count - 1:
+                    break
+        self.edges, self.lengths = edges[kept], lengths[kept]
+
+
+class DiversityTracker:
+    """SWDI of the heuristics observed since the last `step`, and CDI of all the heuristics observed."""
+
+    def __init__(self, similarity: float) -> None:
+        self.similarity = similarity
+        self.pending = []
+        self.tree = IncrementalMST()
+
+    def observe(self, population: list[dict]) -> None:
+        self.pending += [individual for individual in population if individual.get("exec_success", False)]
+
+    def step(self, embed=None) -> dict:
+        """
+        Add the pending heuristics and return the metrics. `embed` maps codes to embeddings, for the heuristics
+        without an "embedding".
+        """
+        individuals, self.pending = self.pending, []
+        missing = [individual for individual in individuals if individual.get("embedding") is None]
+        vectors = dict(zip(map(id, missing), embed([individual["code"] for individual in missing]))) if (
+                missing and embed is not None) else {}
+        embeddings = [individual["embedding"] if individual.get("embedding") is not None else vectors.get(id(individual))
+                      for individual in individuals]
+        embeddings = [embedding for embedding in embeddings if embedding is not None]
+        if embeddings:
+            self.tree.add(EmbeddingArchive.normalized_embeddings([{"embedding": e} for e in embeddings]))
+        return {"swdi": swdi(np.array(embeddings), self.similarity) if embeddings else 0.0,
+                "cdi": entropy(self.tree.lengths), "heuristics": len(embeddings),
+                "total_heuristics": 0 if self.tree.points is None else len(self.tree.points)}
@@ -0,0 +1,133 @@
+"""
+Code embeddings for the embedding archive of HSEvo_QD/ReEvo_QD and for embedding_cluster.py.
+
+Codes are normalized as before (comments and docstrings removed, autopep8) and embedded by a background thread
+that groups the pending requests into batched `litellm.embedding` calls. Embeddings are stored in a persistent
+SQLite cache (outputs/embedding_cache.sqlite by default) keyed by the model and the hash of the normalized code,
+so a heuristic that comes back, reformatted or with other comments, is not embedded again. `submit` returns a
+future right away, which lets `evaluate_population` request the embeddings of the candidates while they are still
+being evaluated. Local models ("local/...", see utils.local_embedding) are computed in-process and not stored.
+"""
+import concurrent.futures
+import hashlib
+import logging
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from litellm import embedding
+
+from embedding_cluster import remove_comments_and_docstrings, standardize_code
+from utils.llm_client import retry_after_seconds
+from utils.local_embedding import LOCAL_PREFIX, local_embedder
+
+
+def normalize_code(code: str) -> str:
+    return standardize_code(remove_comments_and_docstrings(code))
+
+
+class EmbeddingService:
+    """
+    Batched, cached embeddings of code with `model`.
+    param: cache_path: SQLite database of the cache, None to only cache in memory
+    param: batch_size: maximum number of texts per embedding request
+    param: max_wait: seconds to wait for more requests before sending a partial batch
+    """
+
+    def __init__(self, model: str, cache_path: str = None, batch_size: int = 32, max_wait: float = 0.05,
+                 input_type: str = "query", max_retries: int = 5) -> None:
+        self.model = model
+        self.local = local_embedder(model) if model.startswith(LOCAL_PREFIX) else None
+        self.cache_path = None if self.local is not None else cache_path
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.input_type = input_type
+        self.max_retries = max_retries
+        self.random = random.Random()  # Retry jitter, without consuming the global generator of the run
+        self.memory = {}
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.serve, name="embedding-service", daemon=True)
+        self.thread.start()
+
+    def submit(self, code: str) -> concurrent.futures.Future:
+        """Future of the embedding (a numpy array) of `code`."""
+        future = concurrent.futures.Future()
+        self.requests.put((code, future))
+        return future
+
+    def embed(self, codes: list[str]) -> list[np.ndarray]:
+        futures = [self.submit(code) for code in codes]
+        return [future.result() for future in futures]
+
+    def serve(self) -> None:
+        connection = None
+        if self.cache_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            connection = sqlite3.connect(self.cache_path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB)")
+            connection.commit()
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.requests.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.serve_batch(batch, connection)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def serve_batch(self, batch: list, connection) -> None:
+        missing = {}  # Key -> normalized code, in request order
+        keys = []
+        for code, _ in batch:
+            text = normalize_code(code)
+            key = hashlib.sha256(f"{self.model}\0{text}".encode()).hexdigest()
+            keys.append(key)
+            if key in self.memory or key in missing:
+                continue
+            row = None if connection is None else connection.execute(
+                "SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.memory[key] = np.frombuffer(row[0], dtype=np.float64).copy()
+            else:
+                missing[key] = text
+
+        for start in range(0, len(missing), self.batch_size):
+            chunk = list(missing.items())[start:start + self.batch_size]
+            vectors = self.request([text for _, text in chunk])
+            for (key, _), vector in zip(chunk, vectors):
+                self.memory[key] = vector
+                if connection is not None:
+                    connection.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", (key, vector.tobytes()))
+            if connection is not None:
+                connection.commit()
+
+        for key, (_, future) in zip(keys, batch):
+            future.set_result(self.memory[key].copy())
+
+    def request(self, texts: list[str]) -> list[np.ndarray]:
+        """Embed `texts` with one request, retried with jittered exponential backoff."""
+        if self.local is not None:
+            return self.local(texts)
+        for attempt in range(self.max_retries):
+            try:
+                response = embedding(model=self.model, input=texts, input_type=self.input_type)
+                data = sorted(response['data'], key=lambda item: item['index'])
+                return [np.array(item['embedding'], dtype=np.float64) for item in data]
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = self.random.uniform(0.5, 1.0) * min(30.0, 2 ** attempt)
+                delay = max(delay, retry_after_seconds(e) or 0.0)
+                logging.info(f"Embedding attempt {attempt + 1} failed with error: {e}. Retrying in {delay:.1f}s.")
+                time.sleep(delay)
@@ -0,0 +1,131 @@
+"""
+Persistent evaluation cache, shared by all runs (outputs/eval_cache.sqlite by default).
+
+LLMs often return the same heuristic again, byte-identical or only reformatted, across crossover, mutation and
+harmony search rounds. Results are keyed by the canonical form of the code (its AST without comments and
+docstrings) together with the problem, the problem size, the evaluation script and a fingerprint of the problem
+directory (datasets and solver sources) and the time limits, so a result is only reused for exactly the same
+evaluation.
+
+Only reproducible outcomes are stored: a reported objective, or an exception raised while evaluating the
+heuristic. Timeouts (of the whole evaluation, or reported by the script) and crashed workers are evaluated again
+next time.
+"""
+import ast
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+from utils.dataset_store import STORE
+from utils.result_channel import ResultChannel
+
+
+def canonical_code(code: str) -> str:
+    """Code without comments, docstrings and formatting differences. Unparsable code is only stripped."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code.strip()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and node.body \
+                and isinstance(node.body[0], ast.Expr) and isinstance(node.body[0].value, ast.Constant) \
+                and isinstance(node.body[0].value.value, str):
+            node.body = node.body[1:] or [ast.Pass()]
+    return ast.unparse(tree)
+
+
+def problem_fingerprint(problem_dir: str) -> str:
+    """
+    Hash of every file of the problem: datasets, evaluation scripts and solver sources. Generated directories (the
+    dataset store, temporary directories and bytecode caches) are left out.
+    """
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(problem_dir):
+        dirnames[:] = sorted(dirname for dirname in dirnames
+                             if dirname not in ("__pycache__", STORE) and not dirname.endswith(".tmp"))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(path, problem_dir).encode())
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class CachedRun:
+    """
+    Finished run replaying a cached evaluation. `evaluate_population` processes it like the runs it launches:
+    the cached records are in `channel` and the cached traceback is written to the stdout file.
+    """
+
+    def __init__(self, entry: dict, stdout_filepath: str) -> None:
+        self.channel = ResultChannel()
+        if entry["obj"] is not None:
+            for record in entry["instances"]:
+                self.channel.add(record)
+            self.channel.add({"type": "result", "obj": entry["obj"]})
+        self.returncode = 0 if entry["obj"] is not None else 1
+        with open(stdout_filepath, 'w') as f:
+            f.write("[*] Result reused from the evaluation cache\n" + (entry["traceback"] or ""))
+
+    def poll(self):
+        return self.returncode
+
+    def communicate(self, timeout=None):
+        return None, None
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self) -> None:
+        pass
+
+
+class EvalCache:
+    """Evaluation results of one problem setting, stored in the SQLite database at `db_path`."""
+
+    def __init__(self, db_path: str, problem: str, problem_size, eval_script: str, timeouts: tuple = ()) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        scope = [problem, str(problem_size), os.path.basename(eval_script),
+                 problem_fingerprint(os.path.dirname(eval_script)), *map(str, timeouts)]
+        self.scope = hashlib.sha256("\0".join(scope).encode()).hexdigest()
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, obj REAL, "
+                                "instances TEXT, traceback TEXT, bd TEXT, created REAL)")
+        self.connection.commit()
+        self.hits = 0
+
+    def key(self, code: str) -> str:
+        return hashlib.sha256((self.scope + "\0" + canonical_code(code)).encode()).hexdigest()
+
+    def get(self, code: str) -> dict:
+        """Cached evaluation of `code`, or None."""
+        row = self.connection.execute("SELECT obj, instances, traceback, bd FROM evaluations WHERE key = ?",
+                                      (self.key(code),)).fetchone()
+        if row is None:
+            return None
+        self.hits += 1
+        return {"obj": row[0], "instances": json.loads(row[1]), "traceback": row[2],
+                "bd": json.loads(row[3]) if row[3] else None}
+
+    def put(self, code: str, run, traceback_msg: str, bd_values: dict) -> None:
+        """Store the outcome of a finished run, if it is reproducible."""
+        if isinstance(run, CachedRun):
+            return
+        result = run.channel.result
+        if result is None and (run.returncode != 1 or run.channel.timed_out):  # Timed out, killed or crashed
+            return
+        if result is not None and not run.channel.complete:  # Only evaluated on some instances (racing)
+            return
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(code), None if result is None else result["obj"], json.dumps(run.channel.instances),
+                 traceback_msg if result is None else None, json.dumps(bd_values) if bd_values else None,
+                 time.time()))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logging.info(f"Could not store the evaluation in the cache: {e}")
@@ -0,0 +1,223 @@
+"""
+Pool of warm evaluation workers (see utils/eval_worker.py).
+
+Starting `python3 -u eval.py` for every candidate re-imports numpy/scipy/torch/numba and re-JITs the solver on
+each run. The pool keeps `num_workers` worker processes alive for the whole run and hands them candidates, so
+that cost is paid once per worker. Runs returned by `EvalPool.submit` behave like the `subprocess.Popen`
+objects returned by `_run_code`, so `evaluate_population` can wait on them with `communicate(timeout)` and
+`kill()` them the same way.
+"""
+import atexit
+import collections
+import json
+import logging
+import os
+import selectors
+import subprocess
+import time
+
+from utils.result_channel import ResultChannel
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval_worker.py")
+
+
+class PoolRun:
+    """Handle of one candidate evaluation submitted to an `EvalPool`."""
+
+    def __init__(self, pool, task: dict) -> None:
+        self.pool = pool
+        self.task = task
+        self.args = [task["script_path"]] + [str(arg) for arg in task["args"]]
+        self.returncode = None
+        self.timed_out = False
+        self.deadline = None
+        self.channel = ResultChannel(complete=task["instances"] is None)
+
+    def poll(self):
+        self.pool.step(0)
+        return self.returncode
+
+    def communicate(self, timeout=None):
+        """Wait until the run is finished. Raise `subprocess.TimeoutExpired` if it exceeded its time budget."""
+        self.pool.wait(self)
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.args, self.pool.timeout if timeout is None else timeout)
+        return None, None
+
+    def wait(self, timeout=None):
+        self.communicate(timeout)
+        return self.returncode
+
+    def kill(self) -> None:
+        self.pool.cancel(self)
+
+
+class _Worker:
+    def __init__(self, problem_dir: str, max_rss_mb: float) -> None:
+        task_r, self.task_w = os.pipe()
+        self.result_r, result_w = os.pipe()
+        env = dict(os.environ, EVAL_WORKER_MAX_RSS_MB=str(max_rss_mb or 0))
+        self.process = subprocess.Popen(['python3', '-u', WORKER_SCRIPT, str(task_r), str(result_w), problem_dir],
+                                        pass_fds=(task_r, result_w), env=env)
+        os.close(task_r)
+        os.close(result_w)
+        os.set_blocking(self.result_r, False)
+        self.buffer = b""
+        self.run = None
+
+    def fileno(self) -> int:
+        return self.result_r
+
+    def read_lines(self) -> tuple[list[str], bool]:
+        """Complete lines available from the worker, and whether the worker closed its end of the pipe."""
+        lines = []
+        while True:
+            try:
+                chunk = os.read(self.result_r, 65536)
+            except BlockingIOError:
+                return lines, False
+            if not chunk:
+                return lines, True
+            *new_lines, self.buffer = (self.buffer + chunk).split(b"\n")
+            lines.extend(line.decode() for line in new_lines)
+
+    def send(self, run: PoolRun) -> None:
+        self.run = run
+        os.write(self.task_w, (json.dumps(run.task) + "\n").encode())
+
+    def stop(self, kill=False) -> None:
+        try:
+            os.close(self.task_w)
+        except OSError:
+            pass
+        if kill:
+            self.process.kill()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        os.close(self.result_r)
+
+
+class EvalPool:
+    """
+    Evaluate candidates in `num_workers` long-lived worker processes.
+
+    Each run gets `timeout` seconds once a worker picks it up. A worker is replaced when its run times out or
+    is killed, when it crashes, and when its resident memory grows beyond `max_rss_mb` (if set).
+    """
+
+    def __init__(self, problem_dir: str, num_workers: int, timeout: float, max_rss_mb: float = None) -> None:
+        self.problem_dir = problem_dir
+        self.timeout = timeout
+        self.max_rss_mb = max_rss_mb
+        self.queue = collections.deque()
+        self.selector = selectors.DefaultSelector()
+        self.workers = []
+        for _ in range(num_workers):
+            self._start_worker()
+        atexit.register(self.close)
+
+    def _start_worker(self) -> _Worker:
+        worker = _Worker(self.problem_dir, self.max_rss_mb)
+        self.selector.register(worker, selectors.EVENT_READ, worker)
+        self.workers.append(worker)
+        return worker
+
+    def _replace_worker(self, worker: _Worker, kill=False) -> None:
+        self.selector.unregister(worker)
+        self.workers.remove(worker)
+        worker.stop(kill=kill)
+        self._start_worker()
+
+    def submit(self, script_path: str, workspace_dir: str, args: list, stdout_filepath: str,
+               instances: str = None) -> PoolRun:
+        """
+        Queue `script_path args...` on the candidate in `workspace_dir`, writing its output to `stdout_filepath`.
+        `instances` restricts the run to a slice of the instances (see utils.result_channel).
+        """
+        run = PoolRun(self, {
+            "script_path": script_path,
+            "workspace_dir": os.path.abspath(workspace_dir),
+            "args": [str(arg) for arg in args],
+            "stdout_filepath": os.path.abspath(stdout_filepath),
+            "instances": instances,
+        })
+        self.queue.append(run)
+        self._dispatch()
+        return run
+
+    def _dispatch(self) -> None:
+        for worker in self.workers:
+            if not self.queue:
+                return
+            if worker.run is None:
+                run = self.queue.popleft()
+                run.deadline = time.monotonic() + self.timeout
+                worker.send(run)
+
+    def _finish(self, worker: _Worker, returncode: int, timed_out=False) -> None:
+        run, worker.run = worker.run, None
+        run.returncode = returncode
+        run.timed_out = timed_out
+
+    def step(self, timeout: float) -> None:
+        """Collect finished runs, enforce deadlines and hand queued runs to idle workers."""
+        busy = [worker for worker in self.workers if worker.run is not None]
+        if busy:
+            next_deadline = min(worker.run.deadline for worker in busy)
+            timeout = max(0.0, min(timeout, next_deadline - time.monotonic()))
+        for key, _ in self.selector.select(timeout if busy else 0):
+            worker = key.data
+            lines, closed = worker.read_lines()
+            for line in lines:
+                result = json.loads(line)
+                if "record" in result:  # Reported by the evaluation script while it runs
+                    if worker.run is not None:
+                        worker.run.channel.add(result["record"])
+                    continue
+                self._finish(worker, result["returncode"])
+                if result["recycle"]:
+                    logging.info(f"Evaluation worker uses {result['rss_mb']:.0f} MB, recycling it.")
+                    self._replace_worker(worker)
+                    closed = False
+                    break
+            if closed:  # The worker died
+                returncode = worker.process.wait()
+                if worker.run is not None:
+                    with open(worker.run.task["stdout_filepath"], 'a') as f:
+                        f.write(f"\nTraceback (most recent call last):\nEvaluation worker crashed with exit code {returncode}.\n")
+                    self._finish(worker, returncode if returncode else -1)
+                self._replace_worker(worker)
+
+        now = time.monotonic()
+        for worker in list(self.workers):
+            if worker.run is not None and now > worker.run.deadline:
+                self._finish(worker, -9, timed_out=True)
+                self._replace_worker(worker, kill=True)
+        self._dispatch()
+
+    def wait(self, run: PoolRun) -> None:
+        while run.returncode is None:
+            self.step(1.0)
+
+    def cancel(self, run: PoolRun) -> None:
+        if run.returncode is not None:
+            return
+        if run in self.queue:
+            self.queue.remove(run)
+            run.returncode = -9
+            return
+        for worker in list(self.workers):
+            if worker.run is run:
+                self._finish(worker, -9, timed_out=run.timed_out)
+                self._replace_worker(worker, kill=True)
+        self._dispatch()
+
+    def close(self) -> None:
+        for worker in self.workers:
+            self.selector.unregister(worker)
+            worker.stop(kill=worker.run is not None)
+        self.workers = []
+        self.queue.clear()
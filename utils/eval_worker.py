@@ -0,0 +1,106 @@
+"""
+Long-lived evaluation worker, started by utils.eval_pool.EvalPool.
+
+Usage: python3 -u eval_worker.py <task_fd> <result_fd> <problem_dir>
+
+The worker imports the heavy dependencies and the solver modules of the problem once, then reads one JSON task
+per line from <task_fd>. For every task the candidate workspace module is loaded as a fresh `gpt` module, the
+problem script is run with runpy while fd 1/2 point to the stdout file of the candidate, and one JSON line with
+the return code and the current RSS of the worker is written back to <result_fd>. The records the script reports
+through utils.result_channel are forwarded on <result_fd> as `{"record": ...}` lines while the task runs.
+"""
+import importlib
+import importlib.util
+import json
+import os
+import runpy
+import sys
+import traceback
+
+INSTANCES_ENV = "EVAL_INSTANCES"  # utils.result_channel.INSTANCES_ENV, read by the problem script
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def prewarm(problem_dir: str) -> None:
+    """Import the dependencies and solver modules shared by every evaluation of the problem."""
+    for module_name in ["numpy", "scipy", "torch"]:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+    for module_name in ["gen_inst", "aco", "gls"]:
+        if os.path.isfile(os.path.join(problem_dir, f"{module_name}.py")):
+            importlib.import_module(module_name)
+
+
+def load_candidate(workspace_dir: str):
+    """Load gpt.py of the workspace as a new module, so no state leaks between candidates."""
+    spec = importlib.util.spec_from_file_location("gpt", os.path.join(workspace_dir, "gpt.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["gpt"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_task(task: dict) -> int:
+    """Run one problem script on one candidate. Output goes to the stdout file of the candidate."""
+    saved_path = list(sys.path)
+    saved_fds = os.dup(1), os.dup(2)
+    returncode = 0
+    with open(task["stdout_filepath"], 'w') as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        try:
+            if task.get("instances") is not None:
+                os.environ[INSTANCES_ENV] = task["instances"]
+            sys.argv = [task["script_path"]] + [str(arg) for arg in task["args"]]
+            load_candidate(task["workspace_dir"])
+            runpy.run_path(task["script_path"], run_name="__main__")
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException as e:
+            traceback.print_exc()
+            if isinstance(e, result_channel.EvaluationTimeout):
+                result_channel.report_timeout(str(e))
+            returncode = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            for fd in saved_fds:
+                os.close(fd)
+            sys.path[:] = saved_path
+            sys.modules.pop("gpt", None)
+            os.environ.pop(INSTANCES_ENV, None)
+    return returncode
+
+
+if __name__ == "__main__":
+    task_fd, result_fd, problem_dir = int(sys.argv[1]), int(sys.argv[2]), os.path.abspath(sys.argv[3])
+    max_rss_mb = float(os.environ.get("EVAL_WORKER_MAX_RSS_MB", "0"))
+
+    # sys.path[0] is the directory of this worker (utils/), which would shadow the `utils` package.
+    sys.path[0:1] = [problem_dir, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    prewarm(problem_dir)
+
+    from utils import result_channel
+
+    with os.fdopen(task_fd, 'r') as tasks, os.fdopen(result_fd, 'w', buffering=1) as results:
+        result_channel.set_sink(lambda record: results.write(json.dumps({"record": record}) + "\n"))
+        for line in tasks:
+            returncode = run_task(json.loads(line))
+            rss_mb = current_rss_mb()
+            recycle = max_rss_mb > 0 and rss_mb > max_rss_mb
+            results.write(json.dumps({"returncode": returncode, "rss_mb": rss_mb, "recycle": recycle}) + "\n")
+            if recycle:
+                break
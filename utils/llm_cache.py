@@ -0,0 +1,93 @@
+"""
+Record/replay cache of LLM responses (outputs/llm_cache.sqlite by default), used by utils.llm_client.
+
+A request is keyed by the model, the messages, the temperature, the number of responses and its sample index:
+the k-th identical request of a run is sample k, so a replayed run receives the responses of the recorded run
+in the same order, even when the same prompt is sent several times (e.g. `n` duplicated requests). Modes:
+  - record: always query the LLM and store the responses;
+  - replay: only answer from the cache, a missing response raises LLMError (fully offline runs);
+  - read_through: answer from the cache when possible, otherwise query the LLM and store the responses.
+
+Responses are stored zlib-compressed. When the database grows beyond `max_size_mb`, the least recently used
+entries are evicted.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+MODES = ("record", "replay", "read_through")
+
+
+class LLMCache:
+    """LLM responses stored in the SQLite database at `db_path`."""
+
+    def __init__(self, db_path: str, mode: str = "read_through", max_size_mb: float = 1024) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}. Supported modes: {', '.join(MODES)}")
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.mode = mode
+        self.max_size_bytes = max_size_mb * 2 ** 20
+        self.lock = threading.Lock()  # Lookups happen on the caller threads, stores on the client event loop
+        self.occurrences = {}
+        self.hits = self.misses = 0
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Only effective on a new database
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, contents BLOB, "
+                                "used REAL)")
+        self.connection.commit()
+
+    def key(self, n: int, messages: list[dict], model: str, temperature: float) -> bytes:
+        """Key of the next occurrence of this request in the run."""
+        request = json.dumps([model, messages, float(temperature), n], sort_keys=True, ensure_ascii=False)
+        with self.lock:
+            sample = self.occurrences.get(request, 0)
+            self.occurrences[request] = sample + 1
+        return hashlib.sha256(f"{request}\0{sample}".encode()).digest()
+
+    def get(self, key: bytes) -> list[str]:
+        """Cached response contents, or None. Always None in record mode."""
+        if self.mode == "record":
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT contents FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, key: bytes, contents: list[str]) -> None:
+        try:
+            with self.lock:
+                self.connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                                        (key, zlib.compress(json.dumps(contents).encode(), 9), time.time()))
+                self.connection.commit()
+                self.evict()
+        except sqlite3.Error as e:
+            logging.info(f"Could not store the LLM responses in the cache: {e}")
+
+    def size_bytes(self) -> int:
+        page_count, = self.connection.execute("PRAGMA page_count").fetchone()
+        freelist_count, = self.connection.execute("PRAGMA freelist_count").fetchone()
+        page_size, = self.connection.execute("PRAGMA page_size").fetchone()
+        return (page_count - freelist_count) * page_size
+
+    def evict(self) -> None:
+        """Delete the least recently used tenth of the entries until the database fits in `max_size_mb`."""
+        while self.size_bytes() > self.max_size_bytes:
+            count, = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count == 0:
+                break
+            self.connection.execute("DELETE FROM responses WHERE key IN "
+                                    "(SELECT key FROM responses ORDER BY used LIMIT ?)", (max(1, count // 10),))
+            self.connection.commit()
+            self.connection.execute("PRAGMA incremental_vacuum")
+            logging.info(f"Evicted LLM cache entries, {count} were stored")
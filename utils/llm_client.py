@@ -0,0 +1,255 @@
+"""
+Asynchronous LLM client shared by all chat completions of a run.
+
+Requests are sent with `litellm.acompletion` from one event loop running in a background thread, over a single
+pooled HTTP client (`litellm.aclient_session`), so connections are reused across generations. Callers stay
+synchronous: `LLMClient.submit` returns a `concurrent.futures.Future`.
+
+Per provider (the litellm provider prefix of the model, e.g. `nvidia_nim`), the client limits:
+  - the number of requests in flight, which is halved when the provider rate-limits us and grows back by one
+    after as many successful requests as the current limit (AIMD), up to the configured concurrency;
+  - the requests and tokens per minute, with token buckets (0 disables a limit).
+
+Failed requests are retried with jittered exponential backoff, waiting at least as long as the Retry-After header
+of the error asks. Errors that cannot succeed on retry (bad request, authentication, unknown model) are raised
+immediately.
+
+With a `utils.llm_cache.LLMCache`, responses are recorded and/or replayed instead of querying the LLM.
+"""
+import asyncio
+import concurrent.futures
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import httpx
+import litellm
+
+NON_RETRYABLE_STATUS_CODES = {400, 401, 403, 404}
+
+
+class LLMError(RuntimeError):
+    """A chat completion failed, after all retries if the error was retryable."""
+
+
+def provider_of(model: str) -> str:
+    """litellm provider of `model`, which keys the concurrency and rate limits."""
+    try:
+        return litellm.get_llm_provider(model)[1]
+    except Exception:
+        return model.split("/")[0]
+
+
+def retry_after_seconds(exception: Exception) -> float:
+    """Delay requested by the Retry-After header of the response that caused `exception`, or None."""
+    headers = getattr(exception, "litellm_response_headers", None)
+    if headers is None:
+        headers = getattr(getattr(exception, "response", None), "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        date = email.utils.parsedate_tz(value)
+        return None if date is None else max(email.utils.mktime_tz(date) - time.time(), 0.0)
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate_per_minute`, holding at most one minute of tokens. A rate of 0 never blocks."""
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.rate = rate_per_minute / 60
+        self.capacity = rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> None:
+        """Wait until `amount` tokens are available and take them. Waiting callers are served in order."""
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def debit(self, amount: float) -> None:
+        """Take `amount` more tokens (or give them back if negative), once the actual usage is known."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveLimit:
+    """Limit on the requests in flight to one provider, adapted to its rate limiting (AIMD)."""
+
+    def __init__(self, maximum: int) -> None:
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.active = 0
+        self.successes = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self, rate_limited: bool = False) -> None:
+        async with self.condition:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class ProviderLimits:
+    """Concurrency and rate limits of one provider."""
+
+    def __init__(self, concurrency: int, rpm: float, tpm: float) -> None:
+        self.concurrency = AdaptiveLimit(concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+
+class LLMClient:
+    """
+    Chat completion client running on its own event loop thread.
+    param: concurrency: maximum number of requests in flight per provider
+    param: provider_concurrency: maximum per provider name, overriding `concurrency`
+    param: rpm, tpm: requests and tokens per minute per provider (0 for no limit)
+    param: max_retries: attempts per request before raising LLMError
+    param: max_connections: size of the shared HTTP connection pool
+    param: backoff_base, backoff_max: first and maximum backoff delay in seconds
+    param: cache: LLMCache recording and/or replaying the responses
+    """
+
+    def __init__(self, concurrency: int = 8, provider_concurrency: dict = None, rpm: float = 0, tpm: float = 0,
+                 max_retries: int = 30, max_connections: int = 100, backoff_base: float = 1.0,
+                 backoff_max: float = 60.0, cache=None) -> None:
+        self.concurrency = concurrency
+        self.provider_concurrency = dict(provider_concurrency or {})
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self.providers = {}
+        # Own generator for the retry jitter: the global one drives the selections of the run, which replays repeat
+        self.random = random.Random()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="llm-client", daemon=True)
+        self.thread.start()
+        litellm.aclient_session = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(600.0, connect=10.0))
+
+    def limits(self, provider: str) -> ProviderLimits:
+        if provider not in self.providers:
+            self.providers[provider] = ProviderLimits(self.provider_concurrency.get(provider, self.concurrency),
+                                                      self.rpm, self.tpm)
+        return self.providers[provider]
+
+    def backoff(self, attempt: int, exception: Exception) -> float:
+        """Jittered exponential backoff before retry `attempt + 1`, at least the Retry-After of `exception`."""
+        delay = self.random.uniform(0.5, 1.0) * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        retry_after = retry_after_seconds(exception)
+        return delay if retry_after is None else max(delay, retry_after)
+
+    def estimate_tokens(self, messages: list[dict], model: str) -> int:
+        if self.tpm <= 0:
+            return 0
+        try:
+            return litellm.token_counter(model=model, messages=messages)
+        except Exception:
+            return sum(len(str(message.get("content", ""))) for message in messages) // 4
+
+    async def complete(self, n: int, messages: list[dict], model: str, temperature: float, cache_key=None) -> list:
+        limits = self.limits(provider_of(model))
+        for attempt in range(self.max_retries):
+            await limits.requests.acquire(1)
+            estimate = self.estimate_tokens(messages, model)
+            await limits.tokens.acquire(estimate)
+            await limits.concurrency.acquire()
+            try:
+                response = await litellm.acompletion(model=model, messages=messages, temperature=temperature, n=n)
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                rate_limited = isinstance(e, litellm.RateLimitError) or status_code == 429
+                await limits.concurrency.release(rate_limited)
+                if status_code in NON_RETRYABLE_STATUS_CODES:
+                    raise LLMError(f"Chat completion failed with error: {e}") from e
+                delay = self.backoff(attempt, e)
+                logging.info(f"Attempt {attempt + 1} failed with error: {e}. Retrying in {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            await limits.concurrency.release()
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                limits.tokens.debit(usage.total_tokens - estimate)
+            if cache_key is not None:
+                self.cache.put(cache_key, [choice.message.content for choice in response.choices])
+            return response.choices
+        raise LLMError(f"Chat completion failed after {self.max_retries} attempts.")
+
+    def submit(self, n: int, messages: list[dict], model: str, temperature: float):
+        """Start generating `n` responses to `messages`. Returns a future of the response choices."""
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(n, messages, model, temperature)
+            contents = self.cache.get(cache_key)
+            if contents is not None or self.cache.mode == "replay":
+                future = concurrent.futures.Future()
+                if contents is None:
+                    future.set_exception(LLMError("No recorded response for this request in the LLM cache."))
+                else:
+                    future.set_result([litellm.Choices(index=index, message=litellm.Message(content=content))
+                                       for index, content in enumerate(contents)])
+                return future
+        return asyncio.run_coroutine_threadsafe(self.complete(n, messages, model, temperature, cache_key), self.loop)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(litellm.aclient_session.aclose(), self.loop).result()
+        litellm.aclient_session = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+_client = None
+
+
+def configure(**kwargs) -> LLMClient:
+    """Replace the shared client by one with the given `LLMClient` settings."""
+    global _client
+    if _client is not None:
+        _client.close()
+    _client = LLMClient(**kwargs)
+    return _client
+
+
+def get_client() -> LLMClient:
+    """Shared client, created with the default settings on first use."""
+    global _client
+    if _client is None:
+        _client = LLMClient()
+    return _client
@@ -0,0 +1,149 @@
+"""
+Local code embedders, for running qd_type=embedding without an embedding API.
+
+`embedding_model` values starting with "local/" select one of them:
+- local/hashed: hashed AST features (node types, parent-child node type pairs) and token n-grams (unigrams to
+  trigrams, with literal numbers and strings folded), each block L2-normalized, in `dim` dimensions.
+- local/tfidf: the token n-grams of local/hashed weighted by TF-IDF. The IDF is fitted once, on the seed heuristics
+  of all the problems (prompts/*/seed_func.txt), so that all the embeddings of a run, and of different runs, are in
+  the same space.
+- local/st/<model>: a sentence-transformers model (e.g. local/st/all-MiniLM-L6-v2), which must be installed.
+
+The inputs are normalized codes (see utils.embedding_service.normalize_code).
+"""
+import ast
+import glob
+import io
+import os
+import tokenize
+import zlib
+
+import numpy as np
+
+LOCAL_PREFIX = "local/"
+
+# Corpus of the IDF of local/tfidf
+SEED_FUNCTIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompts", "*",
+                              "seed_func.txt")
+
+
+def _bucket(feature: str, dim: int) -> int:
+    return zlib.crc32(feature.encode()) % dim
+
+
+def ast_features(code: str) -> list[str]:
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    features = []
+    for node in ast.walk(tree):
+        name = type(node).__name__
+        features.append(name)
+        for child in ast.iter_child_nodes(node):
+            features.append(f"{name}>{type(child).__name__}")
+        if isinstance(node, ast.BinOp | ast.AugAssign):
+            features.append(f"{name}:{type(node.op).__name__}")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute | ast.Name):
+            features.append(f"call:{getattr(node.func, 'attr', getattr(node.func, 'id', ''))}")
+    return features
+
+
+def tokens(code: str) -> list[str]:
+    result = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.NUMBER:
+                result.append("<num>")
+            elif token.type == tokenize.STRING:
+                result.append("<str>")
+            elif token.type in (tokenize.NAME, tokenize.OP):
+                result.append(token.string)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        result = code.split()
+    return result
+
+
+def token_ngrams(code: str, n: int = 3) -> list[str]:
+    items = tokens(code)
+    return [" ".join(items[i:i + size]) for size in range(1, n + 1) for i in range(len(items) - size + 1)]
+
+
+def _normalized(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class HashedEmbedder:
+    """AST and token n-gram features hashed into `dim` dimensions each, with sublinear term frequencies."""
+
+    def __init__(self, dim: int = 1024) -> None:
+        self.dim = dim
+
+    def counts(self, features: list[list[str]]) -> np.ndarray:
+        matrix = np.zeros((len(features), self.dim))
+        for row, items in enumerate(features):
+            np.add.at(matrix[row], [_bucket(item, self.dim) for item in items], 1.0)
+        return np.log1p(matrix)
+
+    def __call__(self, codes: list[str]) -> list[np.ndarray]:
+        syntax = _normalized(self.counts([ast_features(code) for code in codes]))
+        lexical = _normalized(self.counts([token_ngrams(code) for code in codes]))
+        return list(np.hstack([syntax, lexical]) / np.sqrt(2))
+
+
+def seed_corpus() -> list[str]:
+    """Normalized seed heuristics of all the problems."""
+    from utils.embedding_service import normalize_code
+    corpus = []
+    for path in sorted(glob.glob(SEED_FUNCTIONS)):
+        with open(path, 'r') as f:
+            corpus.append(normalize_code(f.read()))
+    return corpus
+
+
+class TfidfEmbedder(HashedEmbedder):
+    """
+    Hashed token n-grams weighted by TF-IDF, the IDF being fitted once on `corpus` (by default the seed heuristics,
+    or the first codes embedded if there is none) and then frozen.
+    """
+
+    def __init__(self, dim: int = 2048, corpus: list[str] = None) -> None:
+        super().__init__(dim)
+        corpus = seed_corpus() if corpus is None else corpus
+        self.idf = self.fit(self.counts([token_ngrams(code) for code in corpus])) if corpus else None
+
+    @staticmethod
+    def fit(tf: np.ndarray) -> np.ndarray:
+        """IDF of the documents of term frequencies `tf`."""
+        return np.log((1 + len(tf)) / (1 + (tf > 0).sum(axis=0))) + 1
+
+    def __call__(self, codes: list[str]) -> list[np.ndarray]:
+        tf = self.counts([token_ngrams(code) for code in codes])
+        if self.idf is None:
+            self.idf = self.fit(tf)
+        return list(_normalized(tf * self.idf))
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model: str) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(f"embedding_model local/st/{model} requires the sentence-transformers package") from e
+        self.model = SentenceTransformer(model)
+
+    def __call__(self, codes: list[str]) -> list[np.ndarray]:
+        return list(self.model.encode(codes, batch_size=len(codes), convert_to_numpy=True).astype(np.float64))
+
+
+def local_embedder(model: str):
+    """Embedder of the local `model` ("local/..."), a callable from a list of codes to their vectors."""
+    name = model[len(LOCAL_PREFIX):]
+    if name == "hashed":
+        return HashedEmbedder()
+    if name == "tfidf":
+        return TfidfEmbedder()
+    if name.startswith("st/"):
+        return SentenceTransformerEmbedder(name[len("st/"):])
+    raise ValueError(f"Unknown local embedding model: {model}")
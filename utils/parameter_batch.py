@@ -0,0 +1,191 @@
+"""
+Evaluation of harmony search candidates in one process.
+
+The candidates of a harmony search round are the same heuristic with different default values for its
+parameters. Instead of writing and evaluating one module per parameter vector, `ParameterBatch` starts a single
+utils/run_parameterized.py process, which compiles the heuristic once and runs the problem script for every
+vector with the defaults replaced. Each vector is exposed as a `ParameterRun` that `evaluate_population`
+processes like an `EvalProcess`.
+"""
+import ast
+import json
+import os
+import selectors
+import signal
+import subprocess
+import tempfile
+import time
+
+from utils.result_channel import RESULT_FD_ENV, ResultChannel
+
+PARAMETERIZED_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_parameterized.py")
+
+# Slack given to the runner to report a vector it stopped with its own timer
+TIMEOUT_GRACE = 5.0
+
+
+def _function_defaults(node):
+    args = node.args
+    positional = args.posonlyargs + args.args
+    defaults = list(zip(positional[len(positional) - len(args.defaults):], args.defaults))
+    return defaults + [(arg, default) for arg, default in zip(args.kwonlyargs, args.kw_defaults) if default is not None]
+
+
+def only_defaults_differ(codes: list[str], parameters: list[dict]) -> bool:
+    """
+    Whether every code is the same module except for the default values of the parameters of its vector, in
+    undecorated functions, those defaults being the literal values of the vector.
+    """
+    reference = None
+    for code, values in zip(codes, parameters):
+        if code is None:
+            return False
+        try:
+            module = ast.parse(code)
+        except SyntaxError:
+            return False
+        found = set()
+        for node in ast.walk(module):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            for arg, default in _function_defaults(node):
+                if arg.arg not in values:
+                    continue
+                if node.decorator_list:
+                    return False
+                try:
+                    if ast.literal_eval(default) != values[arg.arg]:
+                        return False
+                except ValueError:
+                    return False
+                found.add(arg.arg)
+                # The defaults of the vector are compared between the codes as placeholders
+                node.args.defaults = [ast.Constant(None) if item is default else item for item in node.args.defaults]
+                node.args.kw_defaults = [ast.Constant(None) if item is default else item
+                                         for item in node.args.kw_defaults]
+        if found != set(values):
+            return False
+        dump = ast.dump(module)
+        if reference is not None and dump != reference:
+            return False
+        reference = dump
+    return True
+
+
+class ParameterRun:
+    """Evaluation of one parameter vector of a `ParameterBatch`."""
+
+    def __init__(self, batch: "ParameterBatch", index: int) -> None:
+        self.batch = batch
+        self.index = index
+        self.channel = ResultChannel()
+        self.returncode = None
+        self.timed_out = False
+
+    def poll(self):
+        self.batch.read(0)
+        return self.returncode
+
+    def communicate(self, timeout=None):
+        """Wait until the vector is evaluated. Raise `subprocess.TimeoutExpired` if it timed out."""
+        self.batch.wait_for(self, timeout)
+        if self.timed_out:
+            raise subprocess.TimeoutExpired(self.batch.args, timeout)
+        return None, None
+
+    def wait(self, timeout=None):
+        self.communicate(timeout)
+        return self.returncode
+
+    def kill(self) -> None:
+        if self.returncode is None:  # Stuck in the runner: the vectors after it are lost too
+            self.batch.kill()
+
+
+class ParameterBatch:
+    """
+    Problem script run by utils/run_parameterized.py for the parameter vectors `parameters` of the heuristic in
+    `workspace_dir`, the log of each vector going to its file of `stdout_filepaths`.
+    """
+
+    def __init__(self, workspace_dir: str, script_path: str, args: list, parameters: list[dict],
+                 stdout_filepaths: list[str], timeout: float) -> None:
+        with tempfile.NamedTemporaryFile('w', suffix=".json", dir=workspace_dir, delete=False) as file:
+            json.dump({"parameters": parameters, "stdout_filepaths": [os.path.abspath(path) for path in
+                                                                      stdout_filepaths],
+                       "timeout": timeout}, file)
+        self.batch_file = file.name
+        for stdout_filepath in stdout_filepaths:  # Vectors the runner never reaches keep an empty log
+            open(stdout_filepath, 'w').close()
+        self.args = ['python3', '-u', PARAMETERIZED_RUNNER, os.path.abspath(workspace_dir), self.batch_file,
+                     script_path, *map(str, args)]
+        read_fd, write_fd = os.pipe()
+        self.process = subprocess.Popen(self.args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        pass_fds=(write_fd,), env=dict(os.environ, **{RESULT_FD_ENV: str(write_fd)}))
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        self.read_fd = read_fd
+        self.buffer = b""
+        self.runs = [ParameterRun(self, index) for index in range(len(parameters))]
+        self.progress = time.monotonic()  # Launch, or end of the last evaluated vector
+
+    def read(self, timeout: float) -> None:
+        """Consume the lines the runner wrote, waiting at most `timeout` seconds for them."""
+        if self.read_fd is None:
+            return
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.read_fd, selectors.EVENT_READ)
+            selector.select(timeout)
+        while True:
+            try:
+                chunk = os.read(self.read_fd, 65536)
+            except BlockingIOError:
+                return
+            if not chunk:
+                self.finish()
+                return
+            *lines, self.buffer = (self.buffer + chunk).split(b"\n")
+            for line in lines:
+                message = json.loads(line)
+                run = self.runs[message["batch"]]
+                if "record" in message:
+                    run.channel.add(message["record"])
+                else:
+                    run.returncode = message["returncode"]
+                    run.timed_out = message["timed_out"]
+                    self.progress = time.monotonic()
+
+    def wait_for(self, run: ParameterRun, timeout: float) -> None:
+        """
+        Read until `run` is evaluated. The runner stops a vector after `timeout` seconds itself; if it does not
+        report any vector for longer than that, it is killed.
+        """
+        while run.returncode is None:
+            if self.read_fd is None:  # The runner exited without evaluating this vector
+                run.returncode = self.process.wait()
+                continue
+            remaining = None if timeout is None else self.progress + timeout + TIMEOUT_GRACE - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                self.kill()
+            else:
+                self.read(remaining)
+
+    def finish(self) -> None:
+        os.close(self.read_fd)
+        self.read_fd = None
+        self.process.wait()
+        for run in self.runs:
+            if run.returncode is None:
+                run.returncode = self.process.returncode
+        if os.path.exists(self.batch_file):
+            os.remove(self.batch_file)
+
+    def kill(self) -> None:
+        """Stop the runner. The vectors it did not report count as timed out."""
+        self.process.kill()
+        for run in self.runs:
+            if run.returncode is None:
+                run.returncode = -signal.SIGKILL
+                run.timed_out = True
+        if self.read_fd is not None:
+            self.finish()
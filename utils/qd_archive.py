@@ -0,0 +1,310 @@
+"""
+Archives of the quality-diversity algorithms (HSEvo_QD, ReEvo_QD).
+"""
+import logging
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class EmbeddingArchive:
+    """
+    Elites of the embedding clusters of qd_type=embedding.
+
+    Individuals are clustered greedily, in order: an individual joins the first cluster whose members all have a
+    cosine similarity above `alpha` with it, or founds a new cluster. Each cluster keeps its best individual.
+
+    The L2-normalized embeddings of the elites live in the rows ("slots") of one contiguous matrix, and the pairs of
+    elites more similar than `alpha` are kept as a sparse graph. Adding individuals computes their similarities to
+    the archive with one matrix product; the clustering then only visits the similar pairs, and the slots of the
+    evicted elites are reused, so the archive is never rebuilt.
+    """
+
+    def __init__(self, alpha: float, obj_type: str = "min") -> None:
+        self.alpha = alpha
+        self.obj_type = obj_type
+        self.reset()
+
+    def reset(self) -> None:
+        self.elites = []
+        self.slots = []  # Row of `matrix` of each elite
+        self.matrix = None
+        self.used = 0  # Rows of `matrix` ever used
+        self.free = []  # Rows of evicted elites
+        self.neighbors = {}  # Slot -> slots of the similar elites
+
+    @staticmethod
+    def normalized_embeddings(individuals: list[dict]) -> np.ndarray:
+        embeddings = np.array([individual["embedding"] for individual in individuals], dtype=np.float64)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    def allocate(self, embedding: np.ndarray) -> int:
+        if self.free:
+            slot = self.free.pop()
+        else:
+            if self.matrix is None or self.used == len(self.matrix):
+                matrix = np.empty((max(64, 2 * self.used), len(embedding)))
+                if self.matrix is not None:
+                    matrix[:self.used] = self.matrix[:self.used]
+                self.matrix = matrix
+            slot = self.used
+            self.used += 1
+        self.matrix[slot] = embedding
+        return slot
+
+    @staticmethod
+    def clusters(count: int, neighbors: dict) -> list[list[int]]:
+        """Greedy clustering of `count` individuals given the sets of their similar individuals, as index lists."""
+        clusters, cluster_of = [], []
+        for i in range(count):
+            similar = neighbors.get(i)
+            candidates = sorted({cluster_of[j] for j in similar if j < i}) if similar else ()
+            for cluster in candidates:
+                if all(member in similar for member in clusters[cluster]):
+                    clusters[cluster].append(i)
+                    cluster_of.append(cluster)
+                    break
+            else:
+                cluster_of.append(len(clusters))
+                clusters.append([i])
+        return clusters
+
+    def update(self, population: list[dict], newcomers: list[dict]) -> list[dict]:
+        """
+        Cluster the elites of `population` followed by the `newcomers`, and return the new elites, in cluster order.
+        Individuals without an embedding (failed evaluations) are left out.
+        """
+        if [id(individual) for individual in population] != [id(individual) for individual in self.elites]:
+            # The population was set without the archive (e.g. during warm-up): start again from it
+            self.reset()
+            newcomers = list(population) + list(newcomers)
+        newcomers = [individual for individual in newcomers if individual.get("embedding") is not None]
+        if not newcomers:
+            return list(self.elites)
+
+        new = self.normalized_embeddings(newcomers)
+        count = len(self.elites)
+        individuals = self.elites + newcomers
+
+        # Similar pairs, as indices into `individuals`
+        position = {slot: i for i, slot in enumerate(self.slots)}
+        neighbors = {position[slot]: {position[other] for other in others} for slot, others in self.neighbors.items()}
+        pairs = []
+        if count:
+            to_elites = (new @ self.matrix[:self.used].T)[:, self.slots] > self.alpha
+            pairs += [(count + k, i) for k, i in zip(*np.nonzero(to_elites))]
+        pairs += [(count + k, count + j) for k, j in zip(*np.nonzero(np.triu(new @ new.T > self.alpha, 1)))]
+        for i, j in pairs:
+            neighbors.setdefault(i, set()).add(j)
+            neighbors.setdefault(j, set()).add(i)
+
+        select = min if self.obj_type == "min" else max
+        keep = [select(cluster, key=lambda i: individuals[i]["obj"])
+                for cluster in self.clusters(len(individuals), neighbors)]
+
+        kept = set(keep)
+        for i, slot in enumerate(self.slots):
+            if i not in kept:
+                self.free.append(slot)
+        slots = [self.slots[i] if i < count else self.allocate(new[i - count]) for i in keep]
+        slot_of = dict(zip(keep, slots))
+        self.neighbors = {}
+        for i in keep:
+            others = {slot_of[j] for j in neighbors.get(i, ()) if j in kept}
+            if others:
+                self.neighbors[slot_of[i]] = others
+        self.elites = [individuals[i] for i in keep]
+        self.slots = slots
+        return list(self.elites)
+
+
+class CellArchive(ABC):
+    """
+    Elites of the cells of the behavior descriptor space of qd_type=bd: each cell keeps its individual of lowest
+    objective. The objective, elite and curiosity of every cell are numpy arrays indexed by cell, so inserting and
+    comparing is O(1) and the statistics are vectorized. Subclasses map descriptors to cells (`cell`).
+
+    The curiosity of a cell counts the offspring of its elite (individuals whose "parents" contain its code path)
+    that entered the archive, minus half of those that did not.
+    """
+
+    def __init__(self, bd_list: list[str]) -> None:
+        self.bd_list = list(bd_list)
+        self.reset()
+
+    def reset(self) -> None:
+        self.elites = []  # Slot -> individual, in the order the cells were filled
+        self.cells = []  # Slot -> cell
+        self.allocate()
+
+    @abstractmethod
+    def allocate(self) -> None:
+        """Create the empty `objs`, `slots` and `curiosity` arrays of the cells."""
+
+    @abstractmethod
+    def cell(self, values: np.ndarray) -> tuple:
+        """Index of the cell of the descriptor `values` into the arrays of the archive."""
+
+    def descriptor(self, individual: dict) -> np.ndarray:
+        try:
+            values = np.array([individual[bd] for bd in self.bd_list], dtype=np.float64)
+        except (KeyError, TypeError, ValueError):
+            return None
+        return values if np.isfinite(values).all() else None
+
+    def insert(self, individual: dict) -> bool:
+        """Add `individual` if its cell is empty or holds a worse elite. Returns whether it entered the archive."""
+        values = self.descriptor(individual)
+        if values is None:
+            logging.info(f"Skipping individual without behavior descriptors {self.bd_list}")
+            return False
+        cell = self.cell(values)
+        slot = self.slots[cell]
+        if slot < 0:
+            self.slots[cell] = len(self.elites)
+            self.elites.append(individual)
+            self.cells.append(cell)
+        elif individual["obj"] < self.objs[cell]:
+            self.elites[slot] = individual
+        else:
+            return False
+        self.objs[cell] = individual["obj"]
+        return True
+
+    def update(self, population: list[dict], newcomers: list[dict]) -> list[dict]:
+        """Add the `newcomers` to the archive of the elites `population`, and return the new elites."""
+        if [id(individual) for individual in population] != [id(individual) for individual in self.elites]:
+            # The population was set without the archive (e.g. during warm-up): start again from it
+            self.reset()
+            for individual in population:
+                self.insert(individual)
+        parent_cells = {individual.get("code_path"): cell for individual, cell in zip(self.elites, self.cells)}
+        for individual in newcomers:
+            entered = self.insert(individual)
+            for path in individual.get("parents", ()):
+                if path in parent_cells:
+                    self.curiosity[parent_cells[path]] += 1.0 if entered else -0.5
+        return list(self.elites)
+
+    @property
+    def filled(self) -> int:
+        return len(self.elites)
+
+    def size(self) -> int:
+        """Number of cells the coverage is relative to."""
+        return self.slots.size
+
+    def coverage(self) -> float:
+        return self.filled / self.size() if self.size() else 0.0
+
+    def selection_probabilities(self, individuals: list[dict], weighting: str = "uniform") -> np.ndarray:
+        """
+        Probabilities of selecting each of `individuals`: equal ("uniform"), or proportional to the curiosity of their
+        cell shifted to be positive ("curiosity"). Individuals outside of the archive get the median weight.
+        """
+        if weighting == "uniform":
+            return np.full(len(individuals), 1.0 / len(individuals))
+        if weighting != "curiosity":
+            raise ValueError(f"Unknown selection weighting: {weighting}")
+        cell_of = {id(individual): cell for individual, cell in zip(self.elites, self.cells)}
+        scores = np.array([self.curiosity[cell_of[id(individual)]] if id(individual) in cell_of else np.nan
+                           for individual in individuals])
+        known = scores[np.isfinite(scores)]
+        if known.size == 0:
+            return np.full(len(individuals), 1.0 / len(individuals))
+        weights = np.where(np.isfinite(scores), scores, np.median(known)) - known.min() + 1.0
+        return weights / weights.sum()
+
+
+class GridArchive(CellArchive):
+    """
+    MAP-Elites grid: cell `floor(value / step)` along each descriptor. With `bounds` ([low, high] per descriptor) the
+    grid is fixed and out-of-range values go to the edge cells; otherwise it extends to every descriptor seen, and the
+    coverage is relative to the bounding box of the filled cells.
+    """
+
+    def __init__(self, bd_list: list[str], bd_step: list[float], bounds: list = None) -> None:
+        self.step = np.array(bd_step, dtype=np.float64)
+        self.bounds = None if bounds is None else np.floor(np.array(bounds, dtype=np.float64).T / self.step).astype(int)
+        super().__init__(bd_list)
+
+    def allocate(self) -> None:
+        if self.bounds is not None:
+            self.origin = self.bounds[0]
+            shape = tuple(self.bounds[1] - self.bounds[0] + 1)
+        else:
+            self.origin = None
+            shape = (0,) * len(self.bd_list)
+        self.objs = np.full(shape, np.inf)
+        self.slots = np.full(shape, -1, dtype=np.int64)
+        self.curiosity = np.zeros(shape)
+
+    def grow(self, bins: np.ndarray) -> None:
+        """Extend the arrays to the cell `bins`, by at least their size in that direction (amortized O(1))."""
+        shape = np.array(self.objs.shape)
+        if self.origin is None:
+            self.origin = bins.copy()
+        low = np.minimum(self.origin, bins)
+        high = np.maximum(self.origin + shape - 1, bins)
+        low = np.where(low < self.origin, np.minimum(low, self.origin - shape), low)
+        high = np.where(high > self.origin + shape - 1, np.maximum(high, self.origin + 2 * shape - 1), high)
+        offset = self.origin - low
+        region = tuple(slice(start, start + size) for start, size in zip(offset, shape))
+        for name, fill in (("objs", np.inf), ("slots", -1), ("curiosity", 0.0)):
+            array = np.full(tuple(high - low + 1), fill, dtype=getattr(self, name).dtype)
+            array[region] = getattr(self, name)
+            setattr(self, name, array)
+        self.cells = [tuple(np.array(cell) + offset) for cell in self.cells]
+        self.origin = low
+
+    def cell(self, values: np.ndarray) -> tuple:
+        bins = np.floor(values / self.step).astype(int)
+        if self.bounds is not None:
+            bins = np.clip(bins, self.bounds[0], self.bounds[1])
+        elif self.origin is None or (bins < self.origin).any() or (bins >= self.origin + self.objs.shape).any():
+            self.grow(bins)
+        return tuple(bins - self.origin)
+
+    def size(self) -> int:
+        if self.bounds is not None or not self.cells:
+            return self.slots.size
+        cells = np.array(self.cells)
+        return int(np.prod(cells.max(axis=0) - cells.min(axis=0) + 1))
+
+
+class CVTArchive(CellArchive):
+    """
+    Centroidal Voronoi tessellation of the descriptor box `bounds` into `cells` cells, for many descriptors, where
+    the cells of a grid would explode. Descriptors are measured in units of `bd_step` and an individual belongs to
+    the cell of the nearest centroid; the centroids are k-means centroids of uniform samples of the box.
+    """
+
+    def __init__(self, bd_list: list[str], bd_step: list[float], bounds: list, cells: int = 256,
+                 samples_per_cell: int = 50, seed: int = 0) -> None:
+        from sklearn.cluster import KMeans
+
+        if bounds is None:
+            raise ValueError("The CVT archive needs the bounds of the behavior descriptors (bd_bounds)")
+        self.step = np.array(bd_step, dtype=np.float64)
+        low, high = np.array(bounds, dtype=np.float64).T / self.step
+        samples = np.random.default_rng(seed).uniform(low, high, size=(cells * samples_per_cell, len(bd_step)))
+        self.centroids = KMeans(n_clusters=cells, n_init=1, random_state=seed).fit(samples).cluster_centers_
+        self.squared_norms = (self.centroids ** 2).sum(axis=1)
+        super().__init__(bd_list)
+
+    def allocate(self) -> None:
+        self.objs = np.full(len(self.centroids), np.inf)
+        self.slots = np.full(len(self.centroids), -1, dtype=np.int64)
+        self.curiosity = np.zeros(len(self.centroids))
+
+    def cell(self, values: np.ndarray) -> tuple:
+        point = values / self.step
+        return (int(np.argmin(self.squared_norms - 2 * self.centroids @ point)),)
+
+
+def bd_archive(cfg) -> CellArchive:
+    """Archive of qd_type=bd selected by `cfg.qd_archive` ("grid" or "cvt")."""
+    if cfg.qd_archive == "cvt":
+        return CVTArchive(cfg.bd_list, cfg.bd_step, cfg.bd_bounds, cfg.cvt_cells)
+    return GridArchive(cfg.bd_list, cfg.bd_step, cfg.bd_bounds)
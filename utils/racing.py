@@ -0,0 +1,83 @@
+"""
+Racing evaluation: every candidate is first evaluated on the first instances of the training set only, and only
+the candidates that are not statistically dominated get the rest of the dataset.
+
+A candidate is dominated when, on the first instances, its objectives are significantly worse than those of the
+current elitist or than the per-instance median of the other candidates (one-sided paired t-test at level
+`alpha`; a single instance is never enough to drop a candidate). The result of a
+dominated candidate is not marked complete: the mean objective of its first instances is not comparable with
+full-dataset objectives, so the candidate is marked invalid (objective inf) before it reaches the elitist, the
+archive or the population, and its result is never stored in the evaluation cache.
+"""
+import logging
+import subprocess
+
+import numpy as np
+from scipy import stats
+
+from utils.supervisor import supervise
+
+
+def dominated(objs: list[float], reference: list[float], alpha: float) -> bool:
+    """
+    Whether the (minimized) `objs` are significantly worse than the `reference` objectives of the same instances, by
+    a one-sided paired t-test at level `alpha`.
+    """
+    diffs = np.asarray(objs, dtype=float) - np.asarray(reference, dtype=float)
+    if len(diffs) < 2 or not np.all(np.isfinite(diffs)):
+        return False
+    std = diffs.std(ddof=1)
+    if std == 0:
+        return diffs.mean() > 0
+    return diffs.mean() > stats.t.ppf(1 - alpha, len(diffs) - 1) * std / np.sqrt(len(diffs))
+
+
+def race(runs: list, timeout: float, first_instances: int, alpha: float, obj_type: str, elitist_objs: list,
+         continue_run) -> list:
+    """
+    Wait for the runs restricted to the first `first_instances` instances, then replace the runs of the candidates
+    that are not dominated by `continue_run(index)`, which evaluates the remaining instances. Other entries of
+    `runs` are returned unchanged.
+    """
+    sign = 1 if obj_type == "min" else -1
+    first_objs = {}
+    for index, run in supervise(runs, timeout):
+        channel = getattr(run, "channel", None)
+        if channel is None or channel.complete:
+            continue
+        try:
+            run.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            continue  # Reported as a timeout by evaluate_population
+        if channel.result is None:
+            continue
+        if not channel.more_instances:  # The whole dataset fits in the first slice
+            channel.complete = True
+            continue
+        first_objs[index] = [sign * record["obj"] for record in channel.instances]
+
+    if not first_objs:
+        return runs
+    elitist = None
+    if elitist_objs is not None and len(elitist_objs) >= first_instances:
+        elitist = [sign * obj for obj in elitist_objs[:first_instances]]
+
+    runs = list(runs)
+    continued = 0
+    for index, objs in first_objs.items():
+        others = [other_objs for other, other_objs in first_objs.items() if other != index]
+        median = np.median(np.array(others), axis=0) if others else None
+        if (median is not None and dominated(objs, median, alpha)) or \
+                (elitist is not None and dominated(objs, elitist, alpha)):
+            logging.info(f"Racing: candidate {index} is dominated after {first_instances} instances, skipping the rest")
+            continue
+        try:
+            run = continue_run(index)
+        except Exception as e:
+            logging.info(f"Racing: could not continue candidate {index}: {e}")
+            continue
+        run.channel.continue_from(runs[index].channel)
+        runs[index] = run
+        continued += 1
+    logging.info(f"Racing: {continued} of {len(first_objs)} candidates continue on the rest of the dataset")
+    return runs
@@ -0,0 +1,257 @@
+"""
+Structured result channel between the evaluation scripts (problems/<problem>/eval.py) and the algorithms.
+
+The evaluation scripts keep printing their human-readable log to stdout, and additionally report one JSON record
+per solved instance and one with the final objective:
+
+    {"type": "instance", "index": 3, "obj": 5.71, "time": 0.82, "peak_mem_mb": 312.5}
+    {"type": "result", "obj": 5.68}
+
+An evaluation cut short by a time limit of its own (e.g. of an instance) reports `{"type": "timeout"}` before
+exiting, so that it is not taken for a reproducible failure of the heuristic.
+
+Scripts that solve their instances together in one batch report them all once the batch is done: the "time" of an
+instance is then its share of the batch, and the records add the wall time of the whole batch, "batch_time".
+
+Runs started with `EvalProcess` receive the write end of a pipe in the EVAL_RESULT_FD environment variable; the
+warm workers of utils.eval_pool install their own sink with `set_sink`. Without either, reporting is a no-op, so
+the scripts still work when run by hand. This module only depends on the standard library, because every
+evaluation imports it.
+
+A run can be restricted to a slice of the training instances ("start:stop", either bound may be omitted) with
+the EVAL_INSTANCES environment variable; the scripts apply it with `select_instances`, which reports
+`{"type": "slice", "more": true}` when instances remain after the slice. utils.racing uses this to evaluate all
+candidates on the first instances before giving the rest of the dataset to the promising ones.
+
+Scripts that solve their instances in parallel read the number of processes they may use from EVAL_INSTANCE_WORKERS
+(`instance_workers`, all the available cores by default) and the time limit of one instance from
+EVAL_INSTANCE_TIMEOUT (`instance_timeout`); main.py sets both from the config for the evaluations of a run.
+"""
+import json
+import logging
+import os
+import resource
+import selectors
+import subprocess
+import time
+
+RESULT_FD_ENV = "EVAL_RESULT_FD"
+INSTANCES_ENV = "EVAL_INSTANCES"
+INSTANCE_WORKERS_ENV = "EVAL_INSTANCE_WORKERS"
+INSTANCE_TIMEOUT_ENV = "EVAL_INSTANCE_TIMEOUT"
+
+_sink = None
+
+
+def set_sink(sink) -> None:
+    """Send the reported records to `sink(record: dict)` instead of the EVAL_RESULT_FD pipe."""
+    global _sink
+    _sink = sink
+
+
+def _report(record: dict) -> None:
+    global _sink
+    if _sink is None:
+        fd = os.environ.get(RESULT_FD_ENV)
+        if fd is None:
+            return
+        stream = os.fdopen(int(fd), 'w', buffering=1)
+        _sink = lambda record: stream.write(json.dumps(record) + "\n")
+    _sink(record)
+
+
+def select_instances(indexed_instances):
+    """
+    Keep the `(index, instance)` pairs inside the instance slice of this run (all of them by default), and report
+    whether instances remain after it.
+    """
+    start, _, stop = os.environ.get(INSTANCES_ENV, ":").partition(":")
+    start, stop = int(start or 0), int(stop) if stop else None
+    for index, instance in indexed_instances:
+        if stop is not None and index >= stop:
+            _report({"type": "slice", "more": True})
+            break
+        if index >= start:
+            yield index, instance
+
+
+class EvaluationTimeout(BaseException):
+    """
+    Raised by the alarm handlers that bound the time of an evaluation (a parameter vector, an instance). Like
+    KeyboardInterrupt, it is not an Exception, so the `except Exception` of a heuristic does not swallow it.
+    """
+
+
+def instance_workers(count: int) -> int:
+    """Number of processes to solve `count` instances with."""
+    workers = int(os.environ.get(INSTANCE_WORKERS_ENV, "0")) or len(os.sched_getaffinity(0))
+    return max(1, min(workers, count))
+
+
+def instance_timeout() -> float:
+    """Time limit of one instance in seconds, None without limit."""
+    return float(os.environ.get(INSTANCE_TIMEOUT_ENV, "0")) or None
+
+
+def peak_memory_mb() -> float:
+    """Peak resident set size of the evaluating process so far, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report_instance(index: int, obj: float, start_time: float = None, **fields) -> None:
+    """
+    Report the objective of instance `index`, solved since `start_time` (a `time.perf_counter()` value). `fields`
+    are added to the record, and may give its "time" instead (e.g. measured by another process, or the share of a
+    batch).
+    """
+    _report({"type": "instance", "index": index, "obj": float(obj),
+             "time": None if start_time is None else time.perf_counter() - start_time, "peak_mem_mb": peak_memory_mb(),
+             **fields})
+
+
+def report_timeout(message: str = None) -> None:
+    """Report that the evaluation is stopped by a time limit."""
+    _report({"type": "timeout", "message": message})
+
+
+def report_result(obj: float, **fields) -> None:
+    """Report the final objective of the evaluation."""
+    _report({"type": "result", "obj": float(obj), **fields})
+
+
+class ResultChannel:
+    """
+    Records of one evaluation, collected as they arrive. `complete` is False while the records only cover a slice
+    of the instances, and `more_instances` whether the dataset has instances after them. `timed_out` is True once
+    the evaluation reported a timeout.
+    """
+
+    def __init__(self, read_fd: int = None, complete: bool = True) -> None:
+        self.read_fd = read_fd
+        self.complete = complete
+        self.instances = []
+        self.result = None
+        self.more_instances = False
+        self.timed_out = False
+        self._continued = False
+        self._buffer = b""
+        if read_fd is not None:
+            os.set_blocking(read_fd, False)
+
+    def fileno(self) -> int:
+        return self.read_fd
+
+    def continue_from(self, earlier: "ResultChannel") -> None:
+        """This run evaluates the remaining instances after those of `earlier`: its result covers all of them."""
+        self.instances[:0] = earlier.instances
+        self.complete = True
+        self._continued = True
+
+    def add(self, record: dict) -> None:
+        if record.get("type") == "instance":
+            self.instances.append(record)
+        elif record.get("type") == "result":
+            if self._continued:  # The training objective is the mean over the instances
+                record = dict(record, obj=sum(instance["obj"] for instance in self.instances) / len(self.instances))
+            self.result = record
+        elif record.get("type") == "timeout":
+            self.timed_out = True
+        elif record.get("type") == "slice":
+            self.more_instances = bool(record.get("more"))
+
+    def read(self) -> bool:
+        """Consume the records available on the pipe. Return False once the writer closed it."""
+        while True:
+            try:
+                chunk = os.read(self.read_fd, 65536)
+            except BlockingIOError:
+                return True
+            if not chunk:
+                return False
+            *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+            for line in lines:
+                try:
+                    self.add(json.loads(line))
+                except ValueError:
+                    logging.info(f"Ignoring malformed evaluation record: {line[:200]!r}")
+
+    def close(self) -> None:
+        if self.read_fd is not None:
+            os.close(self.read_fd)
+            self.read_fd = None
+
+
+class EvalProcess:
+    """
+    Evaluation script running in its own process, writing its log to `stdout_filepath` and its records to a
+    `ResultChannel`. Behaves like the `subprocess.Popen` it wraps; `pidfd` (None where unsupported) becomes
+    readable when the process exits, so utils.supervisor can wait for many of them at once.
+    """
+
+    def __init__(self, args: list[str], stdout_filepath: str, instances: str = None) -> None:
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **{RESULT_FD_ENV: str(write_fd)})
+        if instances is not None:
+            env[INSTANCES_ENV] = instances
+        with open(stdout_filepath, 'w') as f:
+            self.process = subprocess.Popen(args, stdout=f, stderr=f, pass_fds=(write_fd,), env=env)
+        os.close(write_fd)
+        self.args = args
+        self.channel = ResultChannel(read_fd, complete=instances is None)
+        self.start_time = time.monotonic()
+        self.timed_out = False
+        try:
+            self.pidfd = os.pidfd_open(self.process.pid)
+        except (AttributeError, OSError):
+            self.pidfd = None
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def poll(self):
+        if self.channel.read_fd is not None:
+            self.channel.read()
+        return self.process.poll()
+
+    def communicate(self, timeout=None):
+        """Collect records until the process exits. Raise `subprocess.TimeoutExpired` after `timeout` seconds."""
+        if self.channel.read_fd is None:  # Already collected
+            if self.timed_out:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            self.process.wait(timeout)
+            return None, None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.channel, selectors.EVENT_READ)
+            if self.pidfd is not None:
+                selector.register(self.pidfd, selectors.EVENT_READ)
+            while self.process.poll() is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise subprocess.TimeoutExpired(self.args, timeout)
+                if self.pidfd is None:  # The exit can only be noticed by polling
+                    remaining = 1.0 if remaining is None else min(remaining, 1.0)
+                for key, _ in selector.select(remaining):
+                    if key.fileobj is self.channel and not self.channel.read():
+                        selector.unregister(self.channel)
+        self.finish()
+        return None, None
+
+    def finish(self) -> None:
+        """Collect the remaining records of the exited process and release its descriptors."""
+        if self.channel.read_fd is not None:
+            self.channel.read()
+        self.channel.close()
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def wait(self, timeout=None):
+        self.communicate(timeout)
+        return self.returncode
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.wait()
+        self.finish()
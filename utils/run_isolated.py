@@ -0,0 +1,22 @@
+"""
+Run a problem script (eval.py, SLOC.py, ...) against the candidate stored in a workspace directory.
+
+Usage: python3 -u run_isolated.py <workspace_dir> <script_path> [script args...]
+
+The scripts under problems/<problem>/ import the heuristic with ``import gpt``. Running them through this
+launcher puts the candidate workspace in front of the script directory on ``sys.path``, so every candidate
+resolves its own ``gpt`` module and several candidates can be evaluated at the same time.
+"""
+import os
+import runpy
+import sys
+
+
+if __name__ == "__main__":
+    workspace_dir = os.path.abspath(sys.argv[1])
+    script_path = os.path.abspath(sys.argv[2])
+
+    # sys.path[0] is the directory of this launcher (utils/), which would shadow the `utils` package.
+    sys.path[0:1] = [workspace_dir, os.path.dirname(script_path)]
+    sys.argv = [script_path] + sys.argv[3:]
+    runpy.run_path(script_path, run_name="__main__")
@@ -0,0 +1,116 @@
+"""
+Run a problem script for several parameter vectors of one heuristic, in a single process (harmony search).
+
+Usage: python3 -u run_parameterized.py <workspace_dir> <batch_file> <script_path> [script args...]
+
+<batch_file> is a JSON object with the parameter vectors ("parameters", each a dict of parameter name to value),
+the stdout file of every vector ("stdout_filepaths") and the time budget of one vector in seconds ("timeout").
+gpt.py of the workspace is compiled once. For every vector, the compiled module is executed as a fresh `gpt`
+module, the default values of the parameters of its functions are replaced by the vector, and the problem script
+is run with runpy while fd 1/2 point to the stdout file of the vector. The records the script reports through
+utils.result_channel are written to the EVAL_RESULT_FD pipe as `{"batch": k, "record": ...}` lines, followed by
+`{"batch": k, "returncode": ..., "timed_out": ...}` once vector k is done.
+"""
+import json
+import os
+import runpy
+import signal
+import sys
+import traceback
+import types
+
+
+def set_defaults(module, values: dict) -> None:
+    """Replace the default values of the parameters named in `values`, in every function defined by `module`."""
+    for function in vars(module).values():
+        if not isinstance(function, types.FunctionType) or function.__module__ != module.__name__:
+            continue
+        code = function.__code__
+        if function.__defaults__:
+            positional = code.co_varnames[:code.co_argcount]
+            names = positional[len(positional) - len(function.__defaults__):]
+            function.__defaults__ = tuple(values.get(name, default)
+                                          for name, default in zip(names, function.__defaults__))
+        if function.__kwdefaults__:
+            function.__kwdefaults__ = {name: values.get(name, default)
+                                       for name, default in function.__kwdefaults__.items()}
+
+
+def on_alarm(signum, frame):
+    raise result_channel.EvaluationTimeout("The evaluation of this parameter vector timed out")
+
+
+def run_vector(code, gpt_path: str, values: dict, script_path: str, args: list, stdout_filepath: str,
+               timeout: float) -> tuple[int, bool]:
+    """Run the problem script with the parameter vector `values`. Returns the return code and whether it timed out."""
+    saved_path = list(sys.path)
+    saved_fds = os.dup(1), os.dup(2)
+    returncode, timed_out = 0, False
+    with open(stdout_filepath, 'w') as f:
+        os.dup2(f.fileno(), 1)
+        os.dup2(f.fileno(), 2)
+        try:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+            module = types.ModuleType("gpt")
+            module.__file__ = gpt_path
+            sys.modules["gpt"] = module
+            exec(code, module.__dict__)
+            set_defaults(module, values)
+            sys.argv = [script_path] + args
+            runpy.run_path(script_path, run_name="__main__")
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except result_channel.EvaluationTimeout:
+            returncode, timed_out = -signal.SIGALRM, True
+        except BaseException:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            for fd in saved_fds:
+                os.close(fd)
+            sys.path[:] = saved_path
+            sys.modules.pop("gpt", None)
+    return returncode, timed_out
+
+
+if __name__ == "__main__":
+    workspace_dir = os.path.abspath(sys.argv[1])
+    with open(sys.argv[2]) as file:
+        batch = json.load(file)
+    script_path = os.path.abspath(sys.argv[3])
+    args = sys.argv[4:]
+
+    # sys.path[0] is the directory of this runner (utils/), which would shadow the `utils` package.
+    sys.path[0:1] = [workspace_dir, os.path.dirname(script_path),
+                     os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+    from utils import result_channel
+
+    results = os.fdopen(int(os.environ[result_channel.RESULT_FD_ENV]), 'w', buffering=1)
+    os.environ.pop(result_channel.RESULT_FD_ENV)
+    signal.signal(signal.SIGALRM, on_alarm)
+
+    gpt_path = os.path.join(workspace_dir, "gpt.py")
+    with open(gpt_path) as file:
+        source = file.read()
+    try:
+        code = compile(source, gpt_path, "exec")
+    except SyntaxError:
+        code = None
+        error = traceback.format_exc()
+
+    for index, (values, stdout_filepath) in enumerate(zip(batch["parameters"], batch["stdout_filepaths"])):
+        if code is None:
+            with open(stdout_filepath, 'w') as f:
+                f.write(error)
+            returncode, timed_out = 1, False
+        else:
+            result_channel.set_sink(
+                lambda record, index=index: results.write(json.dumps({"batch": index, "record": record}) + "\n"))
+            returncode, timed_out = run_vector(code, gpt_path, values, script_path, args, stdout_filepath,
+                                               batch["timeout"])
+        results.write(json.dumps({"batch": index, "returncode": returncode, "timed_out": timed_out}) + "\n")
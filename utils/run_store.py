@@ -0,0 +1,160 @@
+"""
+Run database (outputs/runs.sqlite by default), replacing the many small files a run writes when `run_store` is set.
+
+Every artifact a run writes goes through `write_artifact(kind, name, content)`: without a store it is written to the
+file `name` of the run directory as before; with a store it is a row of the table `kind` (prompts, responses,
+reflections, populations or logs), keyed by run, iteration and file name. `record_evaluations` stores the evaluated
+individuals (code, code hash, objective, descriptors...) and their stdout in the `individuals` and `evaluations`
+tables, then removes their stdout files and workspaces. Rows are buffered and written in one transaction per
+generation (`flush`). export_run.py writes a stored run back to the file layout.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+
+from utils.utils import candidate_workspace
+
+ARTIFACT_KINDS = ("prompts", "responses", "reflections", "populations", "logs")
+
+SCHEMA = [f"CREATE TABLE IF NOT EXISTS {kind} (run TEXT, iteration INTEGER, name TEXT, content TEXT)"
+          for kind in ARTIFACT_KINDS] + [
+    "CREATE TABLE IF NOT EXISTS individuals (run TEXT, iteration INTEGER, name TEXT, response_id INTEGER, "
+    "code_hash TEXT, code TEXT, obj REAL, exec_success INTEGER, traceback_msg TEXT, data TEXT)",
+    "CREATE TABLE IF NOT EXISTS evaluations (run TEXT, iteration INTEGER, name TEXT, code_hash TEXT, stdout TEXT)",
+] + [f"CREATE INDEX IF NOT EXISTS {table}_run ON {table} (run, iteration)"
+     for table in ARTIFACT_KINDS + ("individuals", "evaluations")] + [
+    "CREATE INDEX IF NOT EXISTS individuals_code ON individuals (code_hash)",
+    "CREATE INDEX IF NOT EXISTS evaluations_code ON evaluations (code_hash)",
+]
+
+# Fields of an individual stored in their own column, or not at all
+COLUMNS = {"code", "obj", "exec_success", "traceback_msg", "response_id", "stdout_filepath", "embedding"}
+
+
+def iteration_of(name: str) -> int:
+    match = re.search(r"iter(\d+)", os.path.basename(name))
+    return int(match.group(1)) if match else None
+
+
+def code_hash(code: str) -> str:
+    return None if code is None else hashlib.sha256(code.encode()).hexdigest()
+
+
+class RunStore:
+    """Tables of the runs in the SQLite database at `db_path`; rows are added to the run `run`."""
+
+    def __init__(self, db_path: str, run: str = None) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.run = run
+        self.lock = threading.Lock()
+        self.pending = {}  # Table -> rows not written yet
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def add(self, table: str, row: tuple) -> None:
+        with self.lock:
+            self.pending.setdefault(table, []).append(row)
+
+    def write(self, kind: str, name: str, content: str) -> None:
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind: {kind}")
+        self.add(kind, (self.run, iteration_of(name), name, content))
+
+    def record(self, population: list[dict]) -> None:
+        for individual in population:
+            stdout_filepath = individual.get("stdout_filepath")
+            name = os.path.basename(stdout_filepath) if stdout_filepath else individual.get("code_path")
+            digest = code_hash(individual.get("code"))
+            data = {key: value for key, value in individual.items() if key not in COLUMNS}
+            self.add("individuals", (self.run, iteration_of(name or ""), name, individual.get("response_id"), digest,
+                                     individual.get("code"), individual.get("obj"),
+                                     int(bool(individual.get("exec_success"))), individual.get("traceback_msg"),
+                                     json.dumps(data, default=str)))
+            if stdout_filepath and os.path.isfile(stdout_filepath):
+                with open(stdout_filepath, 'r') as f:
+                    self.add("evaluations", (self.run, iteration_of(name), name, digest, f.read()))
+                os.remove(stdout_filepath)
+                shutil.rmtree(candidate_workspace(stdout_filepath), ignore_errors=True)
+
+    def flush(self) -> None:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        with self.connection:  # One transaction
+            for table, rows in pending.items():
+                self.connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+    def runs(self) -> list[str]:
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT run FROM individuals ORDER BY run")]
+
+    def artifacts(self, run: str, kind: str) -> list[tuple]:
+        """(iteration, name, content) of the artifacts `kind` of `run`, in the order they were written."""
+        return self.connection.execute(f"SELECT iteration, name, content FROM {kind} WHERE run = ? ORDER BY rowid",
+                                       (run,)).fetchall()
+
+    def individuals(self, run: str) -> list[dict]:
+        """Evaluated individuals of `run`, as dicts like the ones of population_iter*.json."""
+        rows = self.connection.execute("SELECT response_id, code, obj, exec_success, traceback_msg, data "
+                                       "FROM individuals WHERE run = ? ORDER BY rowid", (run,))
+        return [dict(json.loads(data), response_id=response_id, code=code, obj=obj, exec_success=bool(success),
+                     traceback_msg=traceback_msg)
+                for response_id, code, obj, success, traceback_msg, data in rows]
+
+    def export(self, run: str, out_dir: str) -> int:
+        """Write the artifacts and stdout files of `run` to `out_dir`, with their original names."""
+        os.makedirs(out_dir, exist_ok=True)
+        count = 0
+        rows = [artifact[1:] for kind in ARTIFACT_KINDS for artifact in self.artifacts(run, kind)]
+        rows += self.connection.execute("SELECT name, stdout FROM evaluations WHERE run = ? ORDER BY rowid",
+                                        (run,)).fetchall()
+        for name, content in rows:
+            with open(os.path.join(out_dir, name), 'w') as file:
+                file.writelines(content)
+            count += 1
+        return count
+
+
+_store = None
+
+
+def configure(db_path: str, run: str) -> RunStore:
+    """Store the artifacts of this process in the run `run` of the database at `db_path`."""
+    global _store
+    if _store is not None:
+        _store.close()
+    _store = RunStore(db_path, run)
+    atexit.register(_store.flush)
+    return _store
+
+
+def write_artifact(kind: str, name: str, content: str) -> None:
+    """Store `content` as the artifact `name` of the table `kind`, or write it to the file `name` without a store."""
+    if _store is not None:
+        _store.write(kind, name, content)
+    else:
+        with open(name, 'w') as file:
+            file.writelines(content)
+
+
+def record_evaluations(population: list[dict]) -> None:
+    if _store is not None:
+        _store.record(population)
+
+
+def flush() -> None:
+    """Write the rows of the generation, in one transaction."""
+    if _store is not None:
+        _store.flush()
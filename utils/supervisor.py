@@ -0,0 +1,72 @@
+"""
+Event-driven supervision of the evaluations started by `evaluate_population`.
+
+All runs of a population are watched at once instead of waiting on each `communicate(timeout)` in turn, so a slow
+candidate no longer delays collecting the others. Evaluation processes are watched through their result pipe and
+their pidfd: the loop sleeps until a record arrives, a process exits or the next deadline passes. Runs of an
+`EvalPool` are driven by the pool, which enforces their deadlines itself.
+"""
+import selectors
+import time
+
+from utils.eval_pool import PoolRun
+from utils.result_channel import EvalProcess
+
+
+def supervise(runs: list, timeout: float):
+    """
+    Yield `(index, run)` for every entry of `runs` once it is finished, in completion order. Entries that are not
+    running evaluations (None, sandbox results, finished runs) come first. A process still running `timeout`
+    seconds after its launch is killed, and its `communicate` raises `subprocess.TimeoutExpired`, like a pool run
+    that timed out.
+    """
+    processes, pool_runs = {}, {}
+    for index, run in enumerate(runs):
+        if isinstance(run, EvalProcess) and run.channel.read_fd is not None:
+            processes[index] = run
+        elif isinstance(run, PoolRun):
+            pool_runs[index] = run
+        else:
+            yield index, run
+    yield from _supervise_processes(processes, timeout)
+    yield from _supervise_pool(pool_runs)
+
+
+def _supervise_processes(processes: dict, timeout: float):
+    with selectors.DefaultSelector() as selector:
+        for index, run in processes.items():
+            selector.register(run.channel, selectors.EVENT_READ, index)
+            if run.pidfd is not None:
+                selector.register(run.pidfd, selectors.EVENT_READ, index)
+
+        while processes:
+            wait = max(0.0, min(run.start_time for run in processes.values()) + timeout - time.monotonic())
+            if any(run.pidfd is None for run in processes.values()):
+                wait = min(wait, 1.0)  # Exits without a pidfd can only be noticed by polling
+            for key, _ in selector.select(wait):
+                run = processes[key.data]
+                if key.fileobj is run.channel and not run.channel.read():
+                    selector.unregister(run.channel)
+
+            now = time.monotonic()
+            for index, run in list(processes.items()):
+                if run.process.poll() is None:
+                    if now < run.start_time + timeout:
+                        continue
+                    run.timed_out = True
+                for fileobj in [run.channel, run.pidfd]:
+                    if fileobj is not None and fileobj in selector.get_map():
+                        selector.unregister(fileobj)
+                if run.timed_out:
+                    run.kill()
+                else:
+                    run.finish()
+                yield index, processes.pop(index)
+
+
+def _supervise_pool(runs: dict):
+    while runs:
+        for index in [index for index, run in runs.items() if run.returncode is not None]:
+            yield index, runs.pop(index)
+        if runs:
+            next(iter(runs.values())).pool.step(1.0)
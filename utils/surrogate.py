@@ -0,0 +1,47 @@
+"""
+Gaussian process surrogate of the objective over the parameter box of a harmony search.
+
+Harmony search tunes a few continuous parameters of one heuristic, a setting where a Gaussian process fitted on
+the evaluated harmonies predicts the objective well. `expected_improvement` ranks candidate harmonies, so only
+the most promising ones are evaluated for real.
+"""
+import warnings
+
+import numpy as np
+from scipy.stats import norm
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern, WhiteKernel
+
+
+def expected_improvement(observed: np.ndarray, objs: np.ndarray, candidates: np.ndarray, bounds: list,
+                         xi: float = 0.0) -> np.ndarray:
+    """
+    Expected improvement over the best (minimized) objective in `objs` of each row of `candidates`, under a Gaussian
+    process fitted on the `observed` harmonies. Failed evaluations (infinite objectives) count as the worst
+    objective observed. Returns None while fewer than two evaluations succeeded.
+    """
+    objs = np.asarray(objs, dtype=float)
+    finite = np.isfinite(objs)
+    if finite.sum() < 2:
+        return None
+    objs = np.where(finite, objs, objs[finite].max())
+
+    # Work in the unit box, so that one length scale fits parameters of any range
+    lower, upper = np.array(bounds, dtype=float).T
+    span = np.where(upper > lower, upper - lower, 1.0)
+    observed = (np.asarray(observed, dtype=float) - lower) / span
+    candidates = (np.asarray(candidates, dtype=float) - lower) / span
+
+    kernel = ConstantKernel(1.0) * Matern(length_scale=np.full(observed.shape[1], 0.3), length_scale_bounds=(1e-2, 1e2),
+                                          nu=2.5) + WhiteKernel(1e-3, noise_level_bounds=(1e-8, 1e-1))
+    gp = GaussianProcessRegressor(kernel=kernel, normalize_y=True, n_restarts_optimizer=2, random_state=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        gp.fit(observed, objs)
+    mean, std = gp.predict(candidates, return_std=True)
+
+    improvement = objs.min() - mean - xi
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(std > 0, improvement / std, 0.0)
+    return np.where(std > 0, improvement * norm.cdf(z) + std * norm.pdf(z), np.maximum(improvement, 0.0))
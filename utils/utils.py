@@ -1,11 +1,12 @@
-from litellm import completion
 import os
-import logging
 import concurrent.futures
-import time
 import re
 import inspect
 
+from utils.llm_client import get_client
+
+ISOLATED_RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_isolated.py")
+
 
 def file_to_string(filename):
     with open(filename, 'r') as file:
@@ -25,16 +26,23 @@ def filter_traceback(s):
     return ''  # Return an empty string if no Traceback is found
 
 
-def block_until_running(stdout_filepath, log_status=False, iter_num=-1, response_id=-1):
-    # Ensure that the evaluation has started before moving on
-    while True:
-        log = file_to_string(stdout_filepath)
-        if len(log) > 0:
-            if log_status and "Traceback" in log:
-                logging.info(f"Iteration {iter_num}: Code Run {response_id} execution error!")
-            else:
-                logging.info(f"Iteration {iter_num}: Code Run {response_id} successful!")
-            break
+def candidate_workspace(stdout_filepath: str) -> str:
+    """Workspace directory of a candidate, derived from its (unique) stdout file."""
+    name = os.path.splitext(os.path.basename(stdout_filepath))[0]
+    return os.path.join(os.path.dirname(stdout_filepath), "workspaces", name)
+
+
+def write_workspace(code: str, workspace_dir: str) -> str:
+    """Write the candidate code as the importable `gpt` module of its own workspace."""
+    os.makedirs(workspace_dir, exist_ok=True)
+    with open(os.path.join(workspace_dir, "gpt.py"), 'w') as file:
+        file.writelines(code + '\n')
+    return workspace_dir
+
+
+def isolated_command(script_path: str, workspace_dir: str, *args) -> list[str]:
+    """Command running `script_path` with `import gpt` resolved to the module in `workspace_dir`."""
+    return ['python3', '-u', ISOLATED_RUNNER, os.path.abspath(workspace_dir), script_path, *map(str, args)]
 
 
 def extract_description(response: str) -> tuple[str, str]:
@@ -68,6 +76,16 @@ def multi_chat_completion(messages_list: list[list[dict]], n, model, temperature
     ]
     param: n: number of responses to generate for each message in messages_list
     """
+    contents = dict(stream_chat_completion(messages_list, n, model, temperature))
+    return [contents[response_id] for response_id in sorted(contents)]
+
+
+def stream_chat_completion(messages_list: list[list[dict]], n, model, temperature, idle=None):
+    """
+    Same requests as `multi_chat_completion`, but yield `(response_id, content)` as soon as each response arrives.
+    `response_id` is the position of the response in the list `multi_chat_completion` returns.
+    param: idle: called about twice a second while waiting for responses
+    """
     # If messages_list is not a list of list (i.e., only one conversation), convert it to a list of list
     assert isinstance(messages_list, list), "messages_list should be a list."
     try:
@@ -80,41 +98,35 @@ def multi_chat_completion(messages_list: list[list[dict]], n, model, temperature
     if len(messages_list) > 1:
         assert n == 1, "Currently, only n=1 is supported for multi-chat completion."
 
-    num_workers = os.cpu_count()
     if "gpt" not in model:
         # Transform messages if n > 1
-        messages_list *= n
+        messages_list = messages_list * n
         n = 1
-        num_workers = 2
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-        args = [(n, messages, model, temperature) for messages in messages_list]
-        choices = executor.map(lambda p: chat_completion(*p), args)
-
-    contents: list[str] = []
-    for choice in choices:
-        for c in choice:
-            contents.append(c.message.content)
-    return contents
+    # Concurrency, rate limits and retries are handled by the shared client (see utils.llm_client)
+    client = get_client()
+    pending = {client.submit(n, messages, model, temperature): i for i, messages in enumerate(messages_list)}
+    try:
+        while pending:
+            done, _ = concurrent.futures.wait(pending, timeout=None if idle is None else 0.5,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                for j, c in enumerate(future.result()):
+                    yield i * n + j, c.message.content
+            if idle is not None:
+                idle()
+    finally:
+        for future in pending:
+            future.cancel()
 
 
 def chat_completion(n: int, messages: list[dict], model: str, temperature: float) -> list[dict]:
     """
-    Generate n responses using OpenAI Chat Completions API
+    Generate n responses using OpenAI Chat Completions API.
+    Raises utils.llm_client.LLMError when the request keeps failing.
     """
-    response_cur = None
-    for attempt in range(30):
-        try:
-            response_cur = completion(model=model, messages=messages, temperature=temperature, n=n)
-            break
-        except Exception as e:
-            logging.info(f"Attempt {attempt + 1} failed with error: {e}")
-            time.sleep(3)
-    if response_cur is None:
-        logging.info("Code terminated due to too many failed attempts!")
-        exit()
-
-    return response_cur.choices
+    return get_client().submit(n, messages, model, temperature).result()
 
 
 def extract_code_from_generator(content):
@@ -3,6 +3,9 @@ import numpy as np
 import json
 import tiktoken
 from utils.utils import *
+from utils.run_store import flush as flush_run_store, record_evaluations, write_artifact
+from utils.result_channel import EvalProcess
+from utils.supervisor import supervise
 
 
 class ReEvoRF:
@@ -41,7 +44,6 @@ class ReEvoRF:
         logging.info("Function name: " + self.func_name)
 
         self.prompt_dir = f"{self.root_dir}/baselines/reevo/prompts"
-        self.output_file = f"{self.root_dir}/problems/{self.problem}/gpt.py"
 
         # Loading all text prompts
         # Problem-specific prompt components
@@ -125,8 +127,7 @@ class ReEvoRF:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         responses = multi_chat_completion([messages], self.cfg.init_pop_size, self.cfg.model,
                                           self.cfg.temperature + 0.3)  # Increase the temperature for diverse initial population
@@ -148,8 +149,7 @@ class ReEvoRF:
         """
         # Write response to file
         file_name = f"problem_iter{self.iteration}_response{response_id}.txt" if file_name is None else file_name + ".txt"
-        with open(file_name, 'w') as file:
-            file.writelines(response + '\n')
+        write_artifact("responses", file_name, response + '\n')
 
         code = extract_code_from_generator(response)
 
@@ -197,8 +197,8 @@ class ReEvoRF:
                 population[response_id] = self.mark_invalid_individual(population[response_id], str(e))
                 inner_runs.append(None)
 
-        # Update population with objective values
-        for response_id, inner_run in enumerate(inner_runs):
+        # Update population with objective values, in the order the evaluations finish
+        for response_id, inner_run in supervise(inner_runs, self.cfg.timeout):
             if inner_run is None:  # If code execution fails, skip
                 continue
             try:
@@ -210,17 +210,16 @@ class ReEvoRF:
                 continue
 
             individual = population[response_id]
-            stdout_filepath = individual["stdout_filepath"]
-            with open(stdout_filepath, 'r') as f:  # read the stdout file
-                stdout_str = f.read()
-            traceback_msg = filter_traceback(stdout_str)
+            result = inner_run.channel.result
+            traceback_msg = ''
+            if result is None:  # No objective was reported, look for the error in the stdout file
+                with open(individual["stdout_filepath"], 'r') as f:
+                    traceback_msg = filter_traceback(f.read()) or "Invalid std out / objective value!"
 
-            individual = population[response_id]
             # Store objective value for each individual
             if traceback_msg == '':  # If execution has no error
                 try:
-                    individual["obj"] = float(stdout_str.split('\n')[-2]) if self.obj_type == "min" else -float(
-                        stdout_str.split('\n')[-2])
+                    individual["obj"] = result["obj"] if self.obj_type == "min" else -result["obj"]
                     individual["exec_success"] = True
                 except:
                     population[response_id] = self.mark_invalid_individual(population[response_id],
@@ -229,26 +228,21 @@ class ReEvoRF:
                 population[response_id] = self.mark_invalid_individual(population[response_id], traceback_msg)
 
             logging.info(f"Iteration {self.iteration}, response_id {response_id}: Objective value: {individual['obj']}")
+        record_evaluations(population)
         return population
 
     def _run_code(self, individual: dict, response_id) -> subprocess.Popen:
         """
-        Write code into a file and run eval script.
+        Write code into the workspace of the individual and run eval script.
         """
         logging.debug(f"Iteration {self.iteration}: Processing Code Run {response_id}")
 
-        with open(self.output_file, 'w') as file:
-            file.writelines(individual["code"] + '\n')
+        workspace_dir = write_workspace(individual["code"], candidate_workspace(individual["stdout_filepath"]))
 
         # Execute the python file with flags
-        with open(individual["stdout_filepath"], 'w') as f:
-            eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
-            process = subprocess.Popen(['python3', '-u', eval_file_path, f'{self.problem_size}', self.root_dir, "train"],
-                                       stdout=f, stderr=f)
-
-        block_until_running(individual["stdout_filepath"], log_status=True, iter_num=self.iteration,
-                            response_id=response_id)
-        return process
+        eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
+        return EvalProcess(isolated_command(eval_file_path, workspace_dir, self.problem_size, self.root_dir, "train"),
+                           individual["stdout_filepath"])
 
     def update_iter(self) -> None:
         """
@@ -273,6 +267,7 @@ class ReEvoRF:
         logging.info(f"Best obj: {self.best_obj_overall}, Best Code Path: {self.best_code_path_overall}")
         logging.info(f"LLM usage: prompt_tokens = {self.prompt_tokens}, completion_tokens = {self.completion_tokens}")
         logging.info(f"Function Evals: {self.function_evals}")
+        flush_run_store()  # Artifacts of the iteration, in one transaction
         self.iteration += 1
 
     def random_select(self, population: list[dict]) -> list[dict]:
@@ -378,12 +373,10 @@ class ReEvoRF:
         self.cal_usage_LLM([messages], [self.long_term_reflection_str])
         # Write reflections to file
         file_name = f"problem_iter{self.iteration}_short_term_reflections.txt"
-        with open(file_name, 'w') as file:
-            file.writelines("\n".join(short_term_reflections) + '\n')
+        write_artifact("reflections", file_name, "\n".join(short_term_reflections) + '\n')
 
         file_name = f"problem_iter{self.iteration}_long_term_reflection.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(self.long_term_reflection_str + '\n')
+        write_artifact("reflections", file_name, self.long_term_reflection_str + '\n')
 
     def crossover(self, population: list[dict]) -> list[dict]:
         messages_lst = []
@@ -416,8 +409,7 @@ class ReEvoRF:
 
             # Write to file
             file_name = f"problem_iter{self.iteration}_response{num_choice}_prompt.txt"
-            with open(file_name, 'w') as file:
-                file.writelines(json.dumps(pre_messages))
+            write_artifact("prompts", file_name, json.dumps(pre_messages))
             num_choice += 1
 
             messages_lst.append(messages)
@@ -454,8 +446,7 @@ class ReEvoRF:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         if self.print_mutate_prompt:
             logging.info("Mutation Prompt: \nSystem Prompt: \n" + system + "\nUser Prompt: \n" + user)
@@ -519,12 +510,10 @@ class ReEvoRF:
 
         # Write reflections to file
         file_name = f"problem_iter{self.iteration}_lst_code_method.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         file_name = f"problem_iter{self.iteration}_flash_reflection.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(flash_reflection_res)
+        write_artifact("reflections", file_name, flash_reflection_res)
 
     def comprehensive_reflection(self):
         system = self.system_reflector_prompt
@@ -550,12 +539,10 @@ class ReEvoRF:
         self.str_comprehensive_memory = self.external_knowledge + '\n' + comprehensive_response
 
         file_name = f"problem_iter{self.iteration}_comprehensive_reflection_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         file_name = f"problem_iter{self.iteration}_comprehensive_reflection.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(self.str_comprehensive_memory)
+        write_artifact("reflections", file_name, self.str_comprehensive_memory)
 
     def evolve(self):
         while self.function_evals < self.cfg.max_fe:
@@ -3,6 +3,10 @@ import numpy as np
 import json
 import tiktoken
 from utils.utils import *
+from utils.run_store import flush as flush_run_store, record_evaluations, write_artifact
+from utils.result_channel import EvalProcess
+from utils.supervisor import supervise
+from utils.surrogate import expected_improvement
 
 
 class ReEvoHS:
@@ -38,7 +42,6 @@ class ReEvoHS:
         logging.info("Function name: " + self.func_name)
 
         self.prompt_dir = f"{self.root_dir}/baselines/reevo/prompts"
-        self.output_file = f"{self.root_dir}/problems/{self.problem}/gpt.py"
 
         # Loading all text prompts
         # Problem-specific prompt components
@@ -126,8 +129,7 @@ class ReEvoHS:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         responses = multi_chat_completion([messages], self.cfg.init_pop_size, self.cfg.model,
                                           self.cfg.temperature + 0.3)  # Increase the temperature for diverse initial population
@@ -149,8 +151,7 @@ class ReEvoHS:
         """
         # Write response to file
         file_name = f"problem_iter{self.iteration}_response{response_id}.txt" if file_name is None else file_name + ".txt"
-        with open(file_name, 'w') as file:
-            file.writelines(response + '\n')
+        write_artifact("responses", file_name, response + '\n')
 
         code = extract_code_from_generator(response)
 
@@ -180,12 +181,10 @@ class ReEvoHS:
 
         if logHS is False:
             file_name = f"objs_log_iter{self.iteration}.txt"
-            with open(file_name, 'w') as file:
-                file.writelines("\n".join(map(str, objs)) + '\n')
+            write_artifact("logs", file_name, "\n".join(map(str, objs)) + '\n')
         else:
             file_name = f"objs_log_iter{self.iteration}_hs.txt"
-            with open(file_name, 'w') as file:
-                file.writelines("\n".join(map(str, objs + [self.local_sel_hs])) + '\n')
+            write_artifact("logs", file_name, "\n".join(map(str, objs + [self.local_sel_hs])) + '\n')
 
     def evaluate_population(self, population: list[dict], hs_try_idx: int = None) -> list[dict]:
         """
@@ -211,8 +210,8 @@ class ReEvoHS:
                 population[response_id] = self.mark_invalid_individual(population[response_id], str(e))
                 inner_runs.append(None)
 
-        # Update population with objective values
-        for response_id, inner_run in enumerate(inner_runs):
+        # Update population with objective values, in the order the evaluations finish
+        for response_id, inner_run in supervise(inner_runs, self.cfg.timeout):
             if inner_run is None:  # If code execution fails, skip
                 continue
             try:
@@ -224,17 +223,16 @@ class ReEvoHS:
                 continue
 
             individual = population[response_id]
-            stdout_filepath = individual["stdout_filepath"]
-            with open(stdout_filepath, 'r') as f:  # read the stdout file
-                stdout_str = f.read()
-            traceback_msg = filter_traceback(stdout_str)
+            result = inner_run.channel.result
+            traceback_msg = ''
+            if result is None:  # No objective was reported, look for the error in the stdout file
+                with open(individual["stdout_filepath"], 'r') as f:
+                    traceback_msg = filter_traceback(f.read()) or "Invalid std out / objective value!"
 
-            individual = population[response_id]
             # Store objective value for each individual
             if traceback_msg == '':  # If execution has no error
                 try:
-                    individual["obj"] = float(stdout_str.split('\n')[-2]) if self.obj_type == "min" else -float(
-                        stdout_str.split('\n')[-2])
+                    individual["obj"] = result["obj"] if self.obj_type == "min" else -result["obj"]
                     individual["exec_success"] = True
                 except:
                     population[response_id] = self.mark_invalid_individual(population[response_id],
@@ -248,26 +246,21 @@ class ReEvoHS:
             else:
                 logging.info(f"Iteration {self.iteration}, hs_try {hs_try_idx}: Objective value: {individual['obj']}")
 
+        record_evaluations(population)
         return population
 
     def _run_code(self, individual: dict, response_id) -> subprocess.Popen:
         """
-        Write code into a file and run eval script.
+        Write code into the workspace of the individual and run eval script.
         """
         logging.debug(f"Iteration {self.iteration}: Processing Code Run {response_id}")
 
-        with open(self.output_file, 'w') as file:
-            file.writelines(individual["code"] + '\n')
+        workspace_dir = write_workspace(individual["code"], candidate_workspace(individual["stdout_filepath"]))
 
         # Execute the python file with flags
-        with open(individual["stdout_filepath"], 'w') as f:
-            eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
-            process = subprocess.Popen(['python3', '-u', eval_file_path, f'{self.problem_size}', self.root_dir, "train"],
-                                       stdout=f, stderr=f)
-
-        block_until_running(individual["stdout_filepath"], log_status=True, iter_num=self.iteration,
-                            response_id=response_id)
-        return process
+        eval_file_path = f'{self.root_dir}/problems/{self.problem}/eval.py' if self.problem_type != "black_box" else f'{self.root_dir}/problems/{self.problem}/eval_black_box.py'
+        return EvalProcess(isolated_command(eval_file_path, workspace_dir, self.problem_size, self.root_dir, "train"),
+                           individual["stdout_filepath"])
 
     def update_iter(self) -> None:
         """
@@ -292,6 +285,7 @@ class ReEvoHS:
         logging.info(f"Best obj: {self.best_obj_overall}, Best Code Path: {self.best_code_path_overall}")
         logging.info(f"LLM usage: prompt_tokens = {self.prompt_tokens}, completion_tokens = {self.completion_tokens}")
         logging.info(f"Function Evals: {self.function_evals}")
+        flush_run_store()  # Artifacts of the iteration, in one transaction
         self.iteration += 1
 
     def random_select(self, population: list[dict]) -> list[dict]:
@@ -398,12 +392,10 @@ class ReEvoHS:
 
         # Write reflections to file
         file_name = f"problem_iter{self.iteration}_short_term_reflections.txt"
-        with open(file_name, 'w') as file:
-            file.writelines("\n".join(short_term_reflections) + '\n')
+        write_artifact("reflections", file_name, "\n".join(short_term_reflections) + '\n')
 
         file_name = f"problem_iter{self.iteration}_long_term_reflection.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(self.long_term_reflection_str + '\n')
+        write_artifact("reflections", file_name, self.long_term_reflection_str + '\n')
 
     def crossover(self, short_term_reflection_tuple: tuple[list[list[dict]], list[str], list[str]]) -> list[dict]:
         reflection_content_lst, worse_code_lst, better_code_lst = short_term_reflection_tuple
@@ -430,8 +422,7 @@ class ReEvoHS:
 
             # Write to file
             file_name = f"problem_iter{self.iteration}_response{num_choice}_prompt.txt"
-            with open(file_name, 'w') as file:
-                file.writelines(json.dumps(pre_messages))
+            write_artifact("prompts", file_name, json.dumps(pre_messages))
             num_choice += 1
 
             # Print crossover prompt for the first iteration
@@ -465,8 +456,7 @@ class ReEvoHS:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         if self.print_mutate_prompt:
             logging.info("Mutation Prompt: \nSystem Prompt: \n" + system + "\nUser Prompt: \n" + user)
@@ -500,6 +490,8 @@ class ReEvoHS:
         population = []
         for response_id, response in enumerate(responses):
             filename = None if try_hs_idx is None else f"problem_iter{self.iteration}_hs{try_hs_idx}"
+            if filename is not None and len(responses) > 1:  # Batch of harmonies (cfg.hs_batch_size)
+                filename += f"_{response_id}"
             individual = self.response_to_individual(response, response_id, filename)
             population.append(individual)
         return population
@@ -534,17 +526,37 @@ class ReEvoHS:
                 new_harmony[i] = np.random.uniform(bounds[i][0], bounds[i][1])
         return new_harmony
 
-    def update_harmony_memory(self, population_hs, harmony_memory, new_harmony, func_block, parameter_ranges,
+    def update_harmony_memory(self, population_hs, harmony_memory, new_harmonies, func_block, parameter_ranges,
                               try_hs_idx):
-        objs = [individual["obj"] for individual in population_hs]
-        worst_index = np.argmax(np.array(objs))
-
-        new_individual = self.create_population_hs(func_block, parameter_ranges, [new_harmony.tolist()], try_hs_idx)[0]
-
-        if new_individual['obj'] < population_hs[worst_index]['obj']:
-            population_hs[worst_index] = new_individual
-            harmony_memory[worst_index] = new_harmony
-        return population_hs, harmony_memory
+        """
+        Evaluate the new harmonies concurrently, then let each of them replace the worst harmony of the memory if
+        it is better.
+        """
+        new_population = self.create_population_hs(func_block, parameter_ranges,
+                                                   [new_harmony.tolist() for new_harmony in new_harmonies], try_hs_idx)
+
+        for new_individual, new_harmony in zip(new_population, new_harmonies):
+            objs = [individual["obj"] for individual in population_hs]
+            worst_index = np.argmax(np.array(objs))
+            if new_individual['obj'] < population_hs[worst_index]['obj']:
+                population_hs[worst_index] = new_individual
+                harmony_memory[worst_index] = new_harmony
+        return population_hs, harmony_memory, new_population
+
+    def screen_harmonies(self, harmony_memory, bounds, observed, observed_objs, size):
+        """
+        Propose cfg.hs_surrogate_candidates harmonies and keep the `size` ones with the highest expected improvement
+        under a Gaussian process fitted on the evaluated harmonies. Harmonies expected to improve the best objective
+        by less than the fraction cfg.hs_surrogate_min_ei are dropped, so no harmony at all ends the search early.
+        """
+        candidates = np.array([self.create_new_harmony(harmony_memory, bounds)
+                               for _ in range(self.cfg.hs_surrogate_candidates)])
+        improvements = expected_improvement(np.array(observed), observed_objs, candidates, bounds)
+        if improvements is None:  # Not enough successful evaluations to fit the surrogate
+            return list(candidates[:size])
+        best_obj = min(obj for obj in observed_objs if np.isfinite(obj))
+        threshold = self.cfg.hs_surrogate_min_ei * max(abs(best_obj), 1e-12)
+        return [candidates[i] for i in np.argsort(-improvements)[:size] if improvements[i] > threshold]
 
     def harmony_search(self):
         system = self.system_hs_prompt
@@ -558,8 +570,7 @@ class ReEvoHS:
 
         # Write to file
         file_name = f"problem_iter{self.iteration}_prompt.txt"
-        with open(file_name, 'w') as file:
-            file.writelines(json.dumps(pre_messages))
+        write_artifact("prompts", file_name, json.dumps(pre_messages))
 
         responses = multi_chat_completion([messages], 1, self.cfg.model, self.cfg.temperature)
         self.cal_usage_LLM([messages], [str(responses[0])])
@@ -579,10 +590,22 @@ class ReEvoHS:
             self.function_evals -= self.cfg.hm_size
             return None
 
-        for iteration in range(self.cfg.max_iter):
-            new_harmony = self.create_new_harmony(harmony_memory, bounds)
-            population_hs, harmony_memory = self.update_harmony_memory(population_hs, harmony_memory, new_harmony,
-                                                                       func_block, parameter_ranges, iteration)
+        # cfg.max_iter harmonies in total, proposed from the current memory and evaluated cfg.hs_batch_size at a time
+        batch_size = max(1, self.cfg.hs_batch_size)
+        observed, observed_objs = list(harmony_memory), [individual["obj"] for individual in population_hs]
+        for iteration, start in enumerate(range(0, self.cfg.max_iter, batch_size)):
+            size = min(batch_size, self.cfg.max_iter - start)
+            if self.cfg.hs_surrogate:
+                new_harmonies = self.screen_harmonies(harmony_memory, bounds, observed, observed_objs, size)
+                if not new_harmonies:
+                    logging.info(f"Harmony search: no harmony is expected to improve, stopping after {start} harmonies")
+                    break
+            else:
+                new_harmonies = [self.create_new_harmony(harmony_memory, bounds) for _ in range(size)]
+            population_hs, harmony_memory, new_population = self.update_harmony_memory(
+                population_hs, harmony_memory, new_harmonies, func_block, parameter_ranges, iteration)
+            observed += new_harmonies
+            observed_objs += [individual["obj"] for individual in new_population]
         best_obj_id = self.find_best_obj(population_hs)
         population_hs[best_obj_id]["tryHS"] = True
         return population_hs[best_obj_id]